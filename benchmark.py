@@ -0,0 +1,599 @@
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import yaml
+
+import lab6_20211688 as lab
+from floodlight_fake import FloodlightFake, TopologiaSintetica, lanzar_en_proceso, mac_servidor
+
+
+# ==================== DATOS SINTÉTICOS =====================
+
+def mac_sintetica(i):
+    return ":".join(f"{b:02X}" for b in (0x44, 0x11, (i >> 24) & 0xFF, (i >> 16) & 0xFF, (i >> 8) & 0xFF, i & 0xFF))
+
+
+def generar_yaml(ruta, n_alumnos, n_cursos, n_servidores, alumnos_por_curso=40, semilla=354):
+    # Escribe un archivo con la misma forma que datos.yaml
+    rnd = random.Random(semilla)
+    codigos = [20000000 + i for i in range(n_alumnos)]
+    with open(ruta, "w") as f:
+        f.write("alumnos:\n")
+        for i, cod in enumerate(codigos):
+            f.write(f"  - nombre: Alumno {i}\n    codigo: {cod}\n    mac: \"{mac_sintetica(i)}\"\n")
+        f.write("cursos:\n")
+        for i in range(n_cursos):
+            f.write(f"  - codigo: TEL{i:04d}\n    estado: {'DICTANDO' if i % 4 else 'INACTIVO'}\n")
+            f.write(f"    nombre: Curso {i}\n    alumnos:\n")
+            for cod in rnd.sample(codigos, min(alumnos_por_curso, n_alumnos)):
+                f.write(f"      - {cod}\n")
+            f.write("    servidores:\n")
+            f.write(f"      - nombre: Servidor {i % n_servidores + 1}\n        servicios_permitidos:\n")
+            f.write("          - ssh\n")
+            if i % 3 == 0:
+                f.write("          - web\n")
+        f.write("servidores:\n")
+        for i in range(n_servidores):
+            f.write(f"  - nombre: \"Servidor {i + 1}\"\n    ip: 10.0.{i // 250}.{i % 250 + 1}\n    servicios:\n")
+            f.write("      - nombre: ssh\n        protocolo: TCP\n        puerto: 22\n")
+            f.write("      - nombre: web\n        protocolo: TCP\n        puerto: 80\n")
+    return ruta
+
+
+def medir(funcion, memoria=False):
+    if memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = funcion()
+    duracion = time.perf_counter() - inicio
+    pico = None
+    if memoria:
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return resultado, duracion, pico
+
+
+# ==================== IMPORTACIÓN =====================
+
+def bench_import(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = generar_yaml(os.path.join(tmp, "datos.yaml"), args.alumnos, args.cursos, args.servidores)
+        tam = os.path.getsize(ruta)
+        print(f"Fixture: {args.alumnos} alumnos, {args.cursos} cursos, {args.servidores} servidores "
+              f"({tam / 1e6:.1f} MB)")
+
+        cargadores = [("SafeLoader", yaml.SafeLoader)]
+        if hasattr(yaml, "CSafeLoader"):
+            cargadores.append(("CSafeLoader", yaml.CSafeLoader))
+
+        original = lab.YAML_LOADER
+        try:
+            for nombre, cargador in cargadores:
+                for streaming in (False, True):
+                    lab.YAML_LOADER = cargador
+                    _, duracion, pico = medir(lambda: lab.importar_archivo(ruta, streaming=streaming), args.memoria)
+                    modo = "streaming" if streaming else "completo"
+                    linea = f"{nombre:12s} {modo:10s} {duracion:8.2f} s"
+                    if pico is not None:
+                        linea += f"  pico {pico / 1e6:8.1f} MB"
+                    print(linea)
+        finally:
+            lab.YAML_LOADER = original
+
+
+# ==================== FORMATOS =====================
+
+def bench_formatos(args):
+    silencio = contextlib.redirect_stdout(io.StringIO())
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = generar_yaml(os.path.join(tmp, "datos.yaml"), args.alumnos, args.cursos, args.servidores)
+        with silencio:
+            lab.importar_archivo(ruta)
+        print(f"Fixture: {args.alumnos} alumnos, {args.cursos} cursos, {args.servidores} servidores")
+        print(f"{'Formato':24s} {'tamaño MB':>10s} {'guardar s':>10s} {'cargar s':>10s}")
+
+        variantes = [("yaml (Dumper Python)", "yaml", yaml.SafeDumper)]
+        if hasattr(yaml, "CSafeDumper"):
+            variantes.append(("yaml (CSafeDumper)", "yaml", yaml.CSafeDumper))
+        variantes += [("jsonl", "jsonl", None), ("bin (marshal)", "bin", None)]
+
+        original = lab.YAML_DUMPER
+        try:
+            for nombre, extension, dumper in variantes:
+                lab.YAML_DUMPER = dumper
+                archivo = os.path.join(tmp, f"snapshot.{extension}")
+                with silencio:
+                    _, t_guardar, _ = medir(lambda: lab.exportar_archivo(archivo))
+                    _, t_cargar, _ = medir(lambda: lab.importar_archivo(archivo))
+                print(f"{nombre:24s} {os.path.getsize(archivo) / 1e6:10.1f} {t_guardar:10.2f} {t_cargar:10.2f}")
+        finally:
+            lab.YAML_DUMPER = original
+
+
+# ==================== MEMORIA =====================
+
+# Modelo anterior (objetos con __dict__, MAC como texto, inscripciones en
+# lista y servidores del curso como dicts del YAML) con los mismos datos,
+# para comparar solo la representación.
+class AlumnoDict:
+    def __init__(self, nombre, codigo, mac):
+        self.nombre = nombre
+        self.codigo = codigo
+        self.mac = mac
+
+
+class CursoDict:
+    def __init__(self, codigo, estado, nombre, alumnos=None, servidores=None):
+        self.codigo = codigo
+        self.estado = estado
+        self.nombre = nombre
+        self.alumnos = alumnos if alumnos else []
+        self.servidores = servidores if servidores else []
+
+
+class ConexionDict:
+    def __init__(self, handler, alumno, servidor, servicio, compartidos=None, flows=None):
+        self.handler = handler
+        self.alumno = alumno
+        self.servidor = servidor
+        self.servicio = servicio
+        self.flows = flows if flows else []
+        self.compartidos = compartidos if compartidos else []
+
+
+def bytes_por_entidad(construir, n):
+    # Memoria retenida por n entidades creadas por construir(i), medida con
+    # tracemalloc sobre los objetos que siguen vivos al terminar.
+    tracemalloc.start()
+    antes, _ = tracemalloc.get_traced_memory()
+    vivos = [construir(i) for i in range(n)]
+    despues, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del vivos
+    return (despues - antes) / n
+
+
+def bench_memoria(args):
+    n = args.alumnos
+    n_cursos = max(1, n // 50)
+    servidor = lab.Servidor("Servidor 1", "10.0.0.3", [lab.Servicio("ssh", "TCP", 22)])
+    servicio = servidor.servicios[0]
+    dpids = [f"00:00:00:00:00:00:00:{i:02x}" for i in range(1, 4)]
+    # Los textos del YAML llegan como objetos nuevos en cada entidad; se copian
+    # para no heredar el interning de los literales del benchmark.
+    texto = lambda t: "".join(list(t))
+
+    def curso_yaml(i):
+        return (f"TEL{i:04d}", texto("DICTANDO"), f"Curso {i}", [20000000 + (i * 40 + k) % n for k in range(40)],
+                [{"nombre": texto("Servidor 1"), "servicios_permitidos": [texto("ssh"), texto("web")]}])
+
+    def flows(handler):
+        return [(f"{handler}_{t}_{h}", dpids[h]) for h in range(3) for t in ("fwd", "rev")]
+
+    alumno_previo = AlumnoDict("Alumno 0", 20000000, mac_sintetica(0))
+    alumno_nuevo = lab.Alumno("Alumno 0", 20000000, mac_sintetica(0))
+    casos = [
+        ("alumno", n,
+         lambda i: AlumnoDict(f"Alumno {i}", 20000000 + i, mac_sintetica(i)),
+         lambda i: lab.Alumno(f"Alumno {i}", 20000000 + i, mac_sintetica(i))),
+        ("curso (40 alumnos)", n_cursos,
+         lambda i: CursoDict(*curso_yaml(i)),
+         lambda i: lab.Curso(*curso_yaml(i))),
+        ("conexión (3 saltos)", n,
+         lambda i: ConexionDict(f"{20000000 + i}_Servidor 1_ssh", alumno_previo, servidor, servicio,
+                                flows=flows(f"{20000000 + i}_Servidor 1_ssh")),
+         lambda i: lab.Conexion(f"{20000000 + i}_Servidor 1_ssh", alumno_nuevo, servidor, servicio,
+                                flows=flows(f"{20000000 + i}_Servidor 1_ssh"))),
+    ]
+    print(f"Roster sintético: {n} alumnos, {n_cursos} cursos, {n} conexiones")
+    print(f"{'entidad':22s} {'antes (B)':>10s} {'después (B)':>12s} {'ahorro':>8s}")
+    for nombre, cantidad, previo, nuevo in casos:
+        b_previo = bytes_por_entidad(previo, cantidad)
+        b_nuevo = bytes_por_entidad(nuevo, cantidad)
+        print(f"{nombre:22s} {b_previo:10.0f} {b_nuevo:12.0f} {1 - b_nuevo / b_previo:8.0%}")
+
+
+# ==================== ARRANQUE =====================
+
+def conexiones_sinteticas(n, saltos=5):
+    # Registra hasta n conexiones autorizadas con una ruta inventada, sin
+    # controlador: solo para medir cuánto cuesta persistirlas y restaurarlas
+    for handler, (cod, nombre_servidor, nombre_servicio) in list(lab.conexiones_autorizadas().items())[:n]:
+        alumno = lab.base_datos.alumno(cod)
+        servidor = lab.base_datos.servidor(nombre_servidor)
+        servicio = next(s for s in servidor.servicios if s.nombre == nombre_servicio)
+        hops = [(f"00:00:00:00:00:00:00:{i + 1:02x}", 1, 2) for i in range(saltos)]
+        conexion = lab.Conexion(handler, alumno, servidor, servicio, [lab.flow_arp_compartido(h[0]) for h in hops],
+                                None, hops)
+        conexion.flows = [(f["name"], f["switch"]) for f in lab.flows_de_conexion(conexion)]
+        lab.base_datos.agregar_conexion(conexion)
+
+
+def bench_arranque(args):
+    silencio = contextlib.redirect_stdout(io.StringIO())
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = generar_yaml(os.path.join(tmp, "datos.yaml"), args.alumnos, args.cursos, args.servidores)
+        print(f"Fixture: {args.alumnos} alumnos, {args.cursos} cursos, {args.servidores} servidores "
+              f"({os.path.getsize(ruta) / 1e6:.1f} MB de YAML)")
+        with silencio:
+            _, t_yaml, _ = medir(lambda: lab.importar_archivo(ruta))
+        print(f"{'Importar YAML':34s} {t_yaml:8.2f} s")
+
+        db = os.path.join(tmp, "estado.db")
+        _, duracion, _ = medir(lambda: lab.abrir_almacen(db))
+        print(f"{'Crear almacén SQLite':34s} {duracion:8.2f} s")
+        lab.cerrar_almacen()
+        with silencio:
+            _, duracion, _ = medir(lambda: lab.abrir_almacen(db))
+        print(f"{'Arranque desde SQLite':34s} {duracion:8.2f} s  ({t_yaml / duracion:.1f}x más rápido que YAML)")
+
+        # Cada conexión registrada es una escritura incremental
+        _, duracion, _ = medir(lambda: conexiones_sinteticas(args.conexiones))
+        n = len(lab.base_datos.conexiones)
+        if n:
+            print(f"{f'Registrar {n} conexiones':34s} {duracion:8.2f} s  ({duracion / n * 1000:.3f} ms por conexión)")
+        lab.cerrar_almacen()
+        with silencio:
+            _, duracion, _ = medir(lambda: lab.abrir_almacen(db))
+        print(f"{f'Arranque con {n} conexiones':34s} {duracion:8.2f} s  ({os.path.getsize(db) / 1e6:.1f} MB)")
+        lab.cerrar_almacen()
+
+
+# ==================== PLANIFICACIÓN =====================
+
+def red_sintetica(args):
+    # Mismos hosts y topología que levanta preparar_fake, pero sin servidor HTTP
+    fake = FloodlightFake(TopologiaSintetica(args.switches, args.ramas))
+    fake.servidor.server_close()
+    for i in range(args.servidores):
+        fake.agregar_host(mac_servidor(i + 1), [f"10.0.{i // 250}.{i % 250 + 1}"], fake.topologia.switches[0])
+    for i in range(args.alumnos):
+        fake.agregar_host(mac_sintetica(i))
+    return lab.SnapshotRed(fake.dispositivos, fake.topologia.enlaces)
+
+
+def bench_plan(args):
+    silencio = contextlib.redirect_stdout(io.StringIO())
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = generar_yaml(os.path.join(tmp, "datos.yaml"), args.alumnos, args.cursos, args.servidores,
+                            alumnos_por_curso=args.alumnos_por_curso)
+        with silencio:
+            lab.importar_archivo(ruta)
+    red = red_sintetica(args)
+    plan = lab.planificar(red, args.capacidad, args.workers)
+    if not args.validar:
+        return plan
+
+    # Provisiona de verdad contra el controlador de prueba y compara
+    fake = preparar_fake(args)
+    try:
+        with silencio:
+            lab.provisionar_curso(workers=args.workers)
+        instalados = {}
+        for switch, flows in lab.controller.get("/wm/staticflowpusher/list/all/json").json().items():
+            if flows:
+                instalados[switch.lower()] = len(flows)
+    finally:
+        fake.terminate()
+    proyectados = dict(plan["switches_mas_cargados"])
+    distintos = {s: (proyectados.get(s), n) for s, n in instalados.items()
+                 if s in proyectados and proyectados[s] != n}
+    print(f"Validación: {sum(instalados.values())} flows instalados vs {plan['flows_totales']} proyectados; "
+          f"{len(distintos)} switches del top con conteo distinto {distintos or ''}")
+    return plan
+
+
+# ==================== EXTREMO A EXTREMO =====================
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    k = (len(ordenados) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(ordenados) - 1)
+    return ordenados[i] + (ordenados[j] - ordenados[i]) * (k - i)
+
+
+def preparar_fake(args):
+    # Levanta el controlador de prueba (en otro proceso) con todos los
+    # alumnos y servidores del roster como hosts y apunta el programa hacia él
+    hosts = [(mac_servidor(i + 1), [f"10.0.{i // 250}.{i % 250 + 1}"], 0) for i in range(args.servidores)]
+    hosts += [(mac_sintetica(i), [], None) for i in range(args.alumnos)]
+    proceso, url = lanzar_en_proceso(args.switches, args.ramas, args.latencia / 1000, hosts)
+    lab.configurar_controlador(url, pool=max(args.workers, lab.CONTROLLER_POOL_SIZE))
+    return proceso
+
+
+def estadisticas_fake():
+    return lab.controller.get("/fake/estadisticas").json()
+
+
+def bench_e2e(args):
+    resultados = {
+        "suite": "e2e",
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "parametros": {k: v for k, v in vars(args).items() if k != "funcion"},
+    }
+    silencio = contextlib.redirect_stdout(io.StringIO())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = generar_yaml(os.path.join(tmp, "datos.yaml"), args.alumnos, args.cursos, args.servidores,
+                            alumnos_por_curso=args.alumnos_por_curso)
+        with silencio:
+            _, duracion, _ = medir(lambda: lab.importar_archivo(ruta))
+        resultados["import_s"] = duracion
+
+    fake = preparar_fake(args)
+    lab.metricas.reiniciar()
+    try:
+        # Latencia de conexiones individuales (como desde el menú)
+        muestras = []
+        tripletas = list(lab.conexiones_autorizadas().items())[:args.muestras]
+        for handler, (cod, nombre_servidor, nombre_servicio) in tripletas:
+            alumno = lab.base_datos.alumno(cod)
+            servidor = lab.base_datos.servidor(nombre_servidor)
+            servicio = next(s for s in servidor.servicios if s.nombre == nombre_servicio)
+            inicio = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                conexion, _ = lab.crear_conexion(alumno, servidor, servicio, verbose=False)
+            muestras.append(time.perf_counter() - inicio)
+        with contextlib.redirect_stdout(io.StringIO()):
+            lab.eliminar_conexiones(list(lab.base_datos.conexiones.values()))
+        resultados["setup_ms"] = {
+            "muestras": len(muestras),
+            "p50": percentil(muestras, 50) * 1000 if muestras else None,
+            "p99": percentil(muestras, 99) * 1000 if muestras else None,
+        }
+
+        # Provisión masiva de todos los cursos
+        peticiones = estadisticas_fake()["peticiones"]
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            lab.provisionar_curso(workers=args.workers)
+        duracion = time.perf_counter() - inicio
+        estadisticas = estadisticas_fake()
+        flows = estadisticas["flows"]
+        resultados["provision"] = {
+            "conexiones": len(lab.base_datos.conexiones),
+            "flows": flows,
+            "segundos": duracion,
+            "flows_por_s": flows / duracion if duracion else None,
+            "peticiones_rest": estadisticas["peticiones"] - peticiones - 1,
+        }
+
+        # Borrado de todas las conexiones
+        peticiones = estadisticas_fake()["peticiones"]
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            lab.eliminar_conexiones(list(lab.base_datos.conexiones.values()), workers=args.workers)
+        duracion = time.perf_counter() - inicio
+        estadisticas = estadisticas_fake()
+        resultados["teardown"] = {
+            "segundos": duracion,
+            "flows_restantes": estadisticas["flows"],
+            "peticiones_rest": estadisticas["peticiones"] - peticiones - 1,
+        }
+    finally:
+        fake.terminate()
+
+    resultados["metricas"] = lab.metricas.instantanea()
+    if args.prometheus:
+        lab.metricas.exportar_prometheus(args.prometheus)
+    imprimir_e2e(resultados)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(resultados, f, indent=2)
+        print(f"Resultados guardados en {args.salida}")
+    return resultados
+
+
+def imprimir_e2e(r):
+    print(f"Importación:           {r['import_s']:.2f} s")
+    setup = r["setup_ms"]
+    if setup["muestras"]:
+        print(f"Conexión individual:   p50 {setup['p50']:.1f} ms  p99 {setup['p99']:.1f} ms  ({setup['muestras']} muestras)")
+    p = r["provision"]
+    print(f"Provisión masiva:      {p['conexiones']} conexiones, {p['flows']} flows en {p['segundos']:.2f} s "
+          f"({p['flows_por_s']:.0f} flows/s, {p['peticiones_rest']} peticiones REST)")
+    t = r["teardown"]
+    print(f"Borrado:               {t['segundos']:.2f} s ({t['peticiones_rest']} peticiones REST, "
+          f"{t['flows_restantes']} flows restantes)")
+    print()
+    for nombre, e in r["metricas"]["endpoints"].items():
+        print(f"{nombre:45s} {e['llamadas']:7d} llamadas  p50 {e['p50_ms']:.2f} ms  p99 {e['p99_ms']:.2f} ms")
+
+
+def clientes_api(puerto, peticiones, concurrencia):
+    # Reparte [(método, ruta, cuerpo)] entre `concurrencia` clientes con
+    # conexión keep-alive propia. Devuelve (segundos, latencias, {estado: n}).
+    latencias = []
+    estados = {}
+    lock = threading.Lock()
+    siguiente = iter(peticiones)
+
+    def cliente():
+        conexion = http.client.HTTPConnection("127.0.0.1", puerto)
+        try:
+            while True:
+                with lock:
+                    peticion = next(siguiente, None)
+                if peticion is None:
+                    return
+                metodo, ruta, cuerpo = peticion
+                datos = json.dumps(cuerpo).encode() if cuerpo is not None else None
+                inicio = time.perf_counter()
+                conexion.request(metodo, ruta, body=datos, headers={"Content-Type": "application/json"})
+                respuesta = conexion.getresponse()
+                respuesta.read()
+                duracion = time.perf_counter() - inicio
+                with lock:
+                    latencias.append(duracion)
+                    estados[respuesta.status] = estados.get(respuesta.status, 0) + 1
+        finally:
+            conexion.close()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        for futuro in [pool.submit(cliente) for _ in range(concurrencia)]:
+            futuro.result()
+    return time.perf_counter() - inicio, latencias, estados
+
+
+def bench_api(args):
+    # Servidor API en un hilo de este proceso, fake en otro proceso. Cada
+    # conexión se pide `--repeticiones` veces seguidas (reintentos o doble
+    # clic del portal) para medir cuántas llamadas ahorra la agrupación.
+    silencio = contextlib.redirect_stdout(io.StringIO())
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = generar_yaml(os.path.join(tmp, "datos.yaml"), args.alumnos, args.cursos, args.servidores,
+                            alumnos_por_curso=args.alumnos_por_curso)
+        with silencio:
+            lab.importar_archivo(ruta)
+
+    fake = preparar_fake(args)
+    lab.cupos_api = threading.BoundedSemaphore(args.workers)
+    servidor = lab.crear_servidor_api("127.0.0.1", 0)
+    threading.Thread(target=servidor.serve_forever, name="api", daemon=True).start()
+    puerto = servidor.server_address[1]
+    lab.metricas.reiniciar()
+    resultados = {}
+    try:
+        tripletas = list(lab.conexiones_autorizadas().items())[:args.conexiones]
+        fases = [
+            ("crear", "POST", [("POST", "/conexiones", {"alumno": cod, "servidor": srv, "servicio": svc})
+                               for _, (cod, srv, svc) in tripletas for _ in range(args.repeticiones)]),
+            ("consultar", "GET", [(("GET", f"/alumnos/{cod}", None) if i % 2 else
+                                   ("GET", f"/conexiones?alumno={cod}", None))
+                                  for i, (_, (cod, _, _)) in enumerate(tripletas)] * 4),
+            ("borrar", "DELETE", [("DELETE", f"/conexiones/{quote(handler)}", None)
+                                  for handler, _ in tripletas for _ in range(args.repeticiones)]),
+        ]
+        for nombre, metodo, peticiones in fases:
+            rest = estadisticas_fake()["peticiones"]
+            with silencio:
+                segundos, latencias, estados = clientes_api(puerto, peticiones, args.concurrencia)
+            estadisticas = estadisticas_fake()
+            resultados[nombre] = {
+                "peticiones": len(peticiones),
+                "segundos": segundos,
+                "por_s": len(peticiones) / segundos if segundos else None,
+                "p50_ms": percentil(latencias, 50) * 1000,
+                "p99_ms": percentil(latencias, 99) * 1000,
+                "estados": estados,
+                "peticiones_rest": estadisticas["peticiones"] - rest - 1,
+                "flows": estadisticas["flows"],
+            }
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+        fake.terminate()
+
+    agrupadas = lab.metricas.instantanea()["agrupadas"]
+    print(f"{len(tripletas)} conexiones x {args.repeticiones}, {args.concurrencia} clientes, "
+          f"{args.workers} cupos hacia el controlador")
+    for nombre, r in resultados.items():
+        estados = ", ".join(f"{estado}: {n}" for estado, n in sorted(r["estados"].items()))
+        print(f"{nombre:10s} {r['peticiones']:6d} peticiones en {r['segundos']:6.2f} s ({r['por_s']:7.0f}/s)  "
+              f"p50 {r['p50_ms']:6.1f} ms  p99 {r['p99_ms']:7.1f} ms  [{estados}]  "
+              f"{r['peticiones_rest']} REST, {r['flows']} flows en el fake")
+    print("Llamadas agrupadas: " + (", ".join(f"{tipo} {n}" for tipo, n in agrupadas.items()) or "ninguna"))
+    resultados["agrupadas"] = agrupadas
+    return resultados
+
+
+# ==================== MAIN =====================
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del Network Policy manager")
+    sub = parser.add_subparsers(dest="suite", required=True)
+
+    p = sub.add_parser("import", help="Importación YAML (cargador C/Python, completo/streaming)")
+    p.add_argument("--alumnos", type=int, default=100000)
+    p.add_argument("--cursos", type=int, default=2000)
+    p.add_argument("--servidores", type=int, default=20)
+    p.add_argument("--memoria", action="store_true", help="medir pico de memoria con tracemalloc (más lento)")
+    p.set_defaults(funcion=bench_import)
+
+    p = sub.add_parser("formatos", help="Tamaño y tiempos de guardar/cargar en yaml, jsonl y bin")
+    p.add_argument("--alumnos", type=int, default=100000)
+    p.add_argument("--cursos", type=int, default=2000)
+    p.add_argument("--servidores", type=int, default=20)
+    p.set_defaults(funcion=bench_formatos)
+
+    p = sub.add_parser("memoria", help="Bytes por alumno/curso/conexión, modelo anterior vs compacto")
+    p.add_argument("--alumnos", type=int, default=100000)
+    p.set_defaults(funcion=bench_memoria)
+
+    p = sub.add_parser("arranque", help="Arranque en caliente desde el almacén SQLite vs importar el YAML")
+    p.add_argument("--alumnos", type=int, default=100000)
+    p.add_argument("--cursos", type=int, default=2000)
+    p.add_argument("--servidores", type=int, default=20)
+    p.add_argument("--conexiones", type=int, default=20000)
+    p.set_defaults(funcion=bench_arranque)
+
+    p = sub.add_parser("plan", help="Planificador de capacidad sobre una red sintética (opcional: validar contra el fake)")
+    p.add_argument("--alumnos", type=int, default=10000)
+    p.add_argument("--cursos", type=int, default=250)
+    p.add_argument("--alumnos-por-curso", type=int, default=40)
+    p.add_argument("--servidores", type=int, default=4)
+    p.add_argument("--switches", type=int, default=63)
+    p.add_argument("--ramas", type=int, default=2)
+    p.add_argument("--capacidad", type=int, default=lab.FLOW_TABLE_CAPACITY)
+    p.add_argument("--workers", type=int, default=lab.BULK_WORKERS)
+    p.add_argument("--latencia", type=float, default=0.0, help="ms por petición del fake al validar")
+    p.add_argument("--validar", action="store_true", help="provisionar contra floodlight_fake.py y comparar")
+    p.add_argument("--agregado", action="store_true", help="modo agregado (flows compartidos en el núcleo)")
+    p.set_defaults(funcion=bench_plan)
+
+    p = sub.add_parser("e2e", help="Setup/provisión/borrado contra floodlight_fake.py")
+    p.add_argument("--alumnos", type=int, default=2000)
+    p.add_argument("--cursos", type=int, default=50)
+    p.add_argument("--alumnos-por-curso", type=int, default=40)
+    p.add_argument("--servidores", type=int, default=4)
+    p.add_argument("--switches", type=int, default=31)
+    p.add_argument("--ramas", type=int, default=2)
+    p.add_argument("--latencia", type=float, default=1.0, help="ms añadidos por el controlador a cada petición")
+    p.add_argument("--workers", type=int, default=lab.BULK_WORKERS)
+    p.add_argument("--muestras", type=int, default=200, help="conexiones creadas una a una para p50/p99")
+    p.add_argument("--salida", help="archivo JSON donde guardar los resultados")
+    p.add_argument("--prometheus", help="archivo donde volcar las métricas en formato Prometheus")
+    p.add_argument("--agregado", action="store_true", help="modo agregado (flows compartidos en el núcleo)")
+    p.set_defaults(funcion=bench_e2e)
+
+    p = sub.add_parser("api", help="Throughput de la API HTTP (crear/consultar/borrar) contra floodlight_fake.py")
+    p.add_argument("--alumnos", type=int, default=2000)
+    p.add_argument("--cursos", type=int, default=50)
+    p.add_argument("--alumnos-por-curso", type=int, default=40)
+    p.add_argument("--servidores", type=int, default=4)
+    p.add_argument("--switches", type=int, default=31)
+    p.add_argument("--ramas", type=int, default=2)
+    p.add_argument("--latencia", type=float, default=1.0, help="ms añadidos por el controlador a cada petición")
+    p.add_argument("--workers", type=int, default=lab.API_MAX_CONCURRENTES,
+                   help="creaciones/borrados simultáneos hacia el controlador")
+    p.add_argument("--conexiones", type=int, default=500)
+    p.add_argument("--repeticiones", type=int, default=2, help="veces que se pide cada conexión")
+    p.add_argument("--concurrencia", type=int, default=32, help="clientes HTTP simultáneos")
+    p.add_argument("--agregado", action="store_true", help="modo agregado (flows compartidos en el núcleo)")
+    p.set_defaults(funcion=bench_api)
+
+    args = parser.parse_args()
+    lab.AGREGAR_FLOWS = getattr(args, "agregado", False)
+    args.funcion(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+import argparse
+import json
+import multiprocessing
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Controlador Floodlight de prueba: implementa solo los endpoints REST que usa
+# lab6_20211688.py, sobre una topología sintética en árbol, para poder medir
+# el programa sin un controlador real.
+
+def dpid(n):
+    return ":".join(f"{b:02x}" for b in n.to_bytes(8, "big"))
+
+
+def mac_servidor(n):
+    return "fa:16:3e:" + ":".join(f"{b:02x}" for b in n.to_bytes(3, "big"))
+
+
+class TopologiaSintetica:
+    # Árbol de switches con `ramas` hijos por nodo. Los puertos 1..ramas de cada
+    # switch van a sus hijos, el puerto `ramas + 1` a su padre y los hosts se
+    # conectan a partir del puerto `ramas + 2`.
+    def __init__(self, switches=7, ramas=2):
+        self.ramas = ramas
+        self.switches = [dpid(i + 1) for i in range(switches)]
+        self.vecinos = {s: {} for s in self.switches}     # dpid -> {puerto: (dpid, puerto)}
+        self.enlaces = []
+        for i in range(1, switches):
+            padre = (i - 1) // ramas
+            puerto_padre = (i - 1) % ramas + 1
+            puerto_hijo = ramas + 1
+            a, b = self.switches[padre], self.switches[i]
+            self.vecinos[a][puerto_padre] = (b, puerto_hijo)
+            self.vecinos[b][puerto_hijo] = (a, puerto_padre)
+            self.enlaces.append({"src-switch": a, "src-port": puerto_padre, "dst-switch": b,
+                                 "dst-port": puerto_hijo, "type": "internal", "direction": "bidirectional"})
+        self.hojas = [s for i, s in enumerate(self.switches) if i * ramas + 1 >= switches] or self.switches
+        self.siguiente_puerto = {s: ramas + 2 for s in self.switches}
+        self._rutas = {}
+
+    def puerto_libre(self, switch):
+        puerto = self.siguiente_puerto[switch]
+        self.siguiente_puerto[switch] += 1
+        return puerto
+
+    def camino(self, origen, destino):
+        # BFS entre switches: [(switch, puerto_salida, siguiente, puerto_entrada)]
+        clave = (origen, destino)
+        if clave not in self._rutas:
+            previo = {origen: None}
+            cola = deque([origen])
+            while cola:
+                actual = cola.popleft()
+                if actual == destino:
+                    break
+                for puerto, (vecino, puerto_vecino) in sorted(self.vecinos[actual].items()):
+                    if vecino not in previo:
+                        previo[vecino] = (actual, puerto, puerto_vecino)
+                        cola.append(vecino)
+            if destino not in previo:
+                self._rutas[clave] = None
+            else:
+                saltos = []
+                actual = destino
+                while previo[actual] is not None:
+                    anterior, puerto_salida, puerto_entrada = previo[actual]
+                    saltos.append((anterior, puerto_salida, actual, puerto_entrada))
+                    actual = anterior
+                self._rutas[clave] = list(reversed(saltos))
+        return self._rutas[clave]
+
+    def ruta(self, src, src_port, dst, dst_port):
+        # Mismo formato que /wm/topology/route/.../json
+        saltos = self.camino(src, dst)
+        if saltos is None:
+            return []
+        ruta = [(src, src_port)]
+        for anterior, puerto_salida, siguiente, puerto_entrada in saltos:
+            ruta.append((anterior, puerto_salida))
+            ruta.append((siguiente, puerto_entrada))
+        ruta.append((dst, dst_port))
+        return [{"switch": s, "port": {"portNumber": p}} for s, p in ruta]
+
+    def cortar_enlace(self, indice):
+        enlace = self.enlaces.pop(indice)
+        del self.vecinos[enlace["src-switch"]][enlace["src-port"]]
+        del self.vecinos[enlace["dst-switch"]][enlace["dst-port"]]
+        self._rutas.clear()
+        return enlace
+
+
+class FloodlightFake:
+    def __init__(self, topologia, latencia=0.0, host="127.0.0.1", puerto=0):
+        self.topologia = topologia
+        self.latencia = latencia
+        self.dispositivos = []
+        self.flows = {}                 # nombre -> flow
+        self.peticiones = 0
+        self._lock = threading.Lock()
+        self._hojas_usadas = 0
+        self.servidor = ThreadingHTTPServer((host, puerto), self._manejador())
+        self.servidor.daemon_threads = True
+        self._hilo = None
+
+    @property
+    def url(self):
+        host, puerto = self.servidor.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    def agregar_host(self, mac, ips=(), switch=None):
+        if switch is None:
+            hojas = self.topologia.hojas
+            switch = hojas[self._hojas_usadas % len(hojas)]
+            self._hojas_usadas += 1
+        puerto = self.topologia.puerto_libre(switch)
+        self.dispositivos.append({
+            "mac": [mac.lower()],
+            "ipv4": list(ips),
+            "vlan": ["0x0"],
+            "attachmentPoint": [{"switchDPID": switch, "port": puerto}],
+            "lastSeen": int(time.time() * 1000),
+        })
+        return switch, puerto
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self.servidor.serve_forever, name="floodlight-fake", daemon=True)
+        self._hilo.start()
+        return self.url
+
+    def detener(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    # ---- formato de /wm/staticflowpusher/list/all/json ----
+    @staticmethod
+    def _entrada_listado(flow):
+        match = {}
+        proto = str(flow.get("ip_proto", "")).lower()
+        capa4 = {"0x06": "tcp", "0x6": "tcp", "6": "tcp", "0x11": "udp", "17": "udp"}.get(proto, "tcp")
+        for campo, valor in flow.items():
+            if campo in ("switch", "name", "priority", "active", "actions"):
+                continue
+            if campo in ("tp_src", "tp_dst"):
+                campo = f"{capa4}_{campo[3:]}"
+            valor = str(valor)
+            if campo == "eth_type" and valor.startswith("0x"):
+                valor = "0x" + valor            # Floodlight lo lista como 0x0x800
+            match[campo] = valor
+        acciones = str(flow.get("actions", ""))
+        if acciones.lower() == "normal":
+            acciones = "output=NORMAL"
+        return {
+            "version": "OF_13",
+            "command": "ADD",
+            "cookie": "45035996273704960",
+            "priority": str(flow.get("priority", "32768")),
+            "idleTimeoutSec": "0",
+            "hardTimeoutSec": "0",
+            "match": match,
+            "instructions": {"instruction_apply_actions": {"actions": acciones}},
+        }
+
+    def listar_flows(self):
+        with self._lock:
+            flows = list(self.flows.items())
+        listado = {s: [] for s in self.topologia.switches}
+        for nombre, flow in flows:
+            listado.setdefault(flow["switch"], []).append({nombre: self._entrada_listado(flow)})
+        return listado
+
+    def _manejador(self):
+        fake = self
+        patron_ruta = re.compile(r"^/wm/topology/route/([^/]+)/([^/]+)/([^/]+)/([^/]+)/json$")
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Sin esto, cabeceras y cuerpo salen en segmentos separados y el
+            # ACK retardado de TCP añade ~40 ms a cada respuesta
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, codigo, cuerpo):
+                datos = json.dumps(cuerpo).encode()
+                self.send_response(codigo)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def _leer_json(self):
+                largo = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(largo) or b"{}")
+
+            def _antes(self):
+                with fake._lock:
+                    fake.peticiones += 1
+                if fake.latencia:
+                    time.sleep(fake.latencia)
+
+            def do_GET(self):
+                self._antes()
+                if self.path == "/wm/device/":
+                    return self._responder(200, fake.dispositivos)
+                if self.path == "/wm/topology/links/json":
+                    return self._responder(200, fake.topologia.enlaces)
+                if self.path == "/wm/staticflowpusher/list/all/json":
+                    return self._responder(200, fake.listar_flows())
+                if self.path == "/fake/estadisticas":
+                    return self._responder(200, {"peticiones": fake.peticiones, "flows": len(fake.flows)})
+                m = patron_ruta.match(self.path)
+                if m:
+                    src, sp, dst, dp = m.groups()
+                    return self._responder(200, fake.topologia.ruta(src, int(sp), dst, int(dp)))
+                self._responder(404, {"error": f"ruta no implementada: {self.path}"})
+
+            def do_POST(self):
+                self._antes()
+                if self.path != "/wm/staticflowpusher/json":
+                    return self._responder(404, {"error": f"ruta no implementada: {self.path}"})
+                flow = self._leer_json()
+                if "name" not in flow or "switch" not in flow:
+                    return self._responder(400, {"status": "Error! Falta name o switch."})
+                with fake._lock:
+                    fake.flows[flow["name"]] = flow
+                self._responder(200, {"status": "Entry pushed"})
+
+            def do_DELETE(self):
+                self._antes()
+                if self.path != "/wm/staticflowpusher/json":
+                    return self._responder(404, {"error": f"ruta no implementada: {self.path}"})
+                nombre = self._leer_json().get("name")
+                with fake._lock:
+                    fake.flows.pop(nombre, None)
+                self._responder(200, {"status": f"Entry {nombre} deleted"})
+
+        return Manejador
+
+
+def _servir(switches, ramas, latencia, hosts, cola):
+    fake = FloodlightFake(TopologiaSintetica(switches, ramas), latencia)
+    for mac, ips, switch in hosts:
+        fake.agregar_host(mac, ips, None if switch is None else fake.topologia.switches[switch])
+    cola.put(fake.url)
+    fake.servidor.serve_forever()
+
+
+def lanzar_en_proceso(switches, ramas, latencia, hosts):
+    # Corre el controlador de prueba en otro proceso para que no compita por
+    # el GIL con el programa medido. hosts: [(mac, ips, índice_switch o None)].
+    # Devuelve (proceso, url).
+    cola = multiprocessing.Queue()
+    proceso = multiprocessing.Process(target=_servir, args=(switches, ramas, latencia, hosts, cola), daemon=True)
+    proceso.start()
+    return proceso, cola.get(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Floodlight de prueba para el Network Policy manager")
+    parser.add_argument("--puerto", type=int, default=8080)
+    parser.add_argument("--switches", type=int, default=15)
+    parser.add_argument("--ramas", type=int, default=2)
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos añadidos a cada petición")
+    parser.add_argument("--datos", help="archivo YAML cuyos alumnos y servidores se registran como hosts")
+    args = parser.parse_args()
+
+    fake = FloodlightFake(TopologiaSintetica(args.switches, args.ramas), args.latencia, "0.0.0.0", args.puerto)
+    if args.datos:
+        import yaml
+        with open(args.datos) as f:
+            data = yaml.safe_load(f) or {}
+        for s in data.get("servidores", []):
+            fake.agregar_host(mac_servidor(len(fake.dispositivos) + 1), [s["ip"]], fake.topologia.switches[0])
+        for a in data.get("alumnos", []):
+            fake.agregar_host(str(a["mac"]))
+    print(f"Floodlight de prueba escuchando en {fake.url} "
+          f"({len(fake.topologia.switches)} switches, {len(fake.dispositivos)} hosts)")
+    fake.servidor.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,939 @@
-import yaml
-import requests
+import argparse
+import hashlib
+import json
+import os
+import re
+import shlex
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+# yaml y requests se importan al primer uso (cargador_yaml() y
+# ClienteFloodlight.session) para que el CLI arranque rápido
 
     # ==================== CLASES =====================
 
+def _intern(valor):
+    return sys.intern(valor) if isinstance(valor, str) else valor
+
+
+# Seis octetos hexadecimales separados por ":" o "-" (el mismo en todos)
+PATRON_MAC = re.compile(r"[0-9A-Fa-f]{2}([:-])[0-9A-Fa-f]{2}(?:\1[0-9A-Fa-f]{2}){4}")
+
+
+def mac_a_int(mac):
+    if not isinstance(mac, str) or not PATRON_MAC.fullmatch(mac):
+        raise ValueError(f"MAC inválida: {mac!r}")
+    return int(mac[0:2] + mac[3:5] + mac[6:8] + mac[9:11] + mac[12:14] + mac[15:17], 16)
+
+
+def int_a_mac(valor):
+    texto = f"{valor:012X}"
+    return ":".join(texto[i:i + 2] for i in range(0, 12, 2))
+
+
 class Alumno:
+    # La MAC se guarda como entero de 48 bits (mac_int); .mac la devuelve
+    # como texto XX:XX:XX:XX:XX:XX
+    __slots__ = ("nombre", "codigo", "mac_int")
+
     def __init__(self, nombre, codigo, mac):
         self.nombre = nombre
         self.codigo = codigo
         self.mac = mac
 
+    @classmethod
+    def desde_int(cls, nombre, codigo, mac_int):
+        # Sin volver a parsear la MAC (carga desde el almacén)
+        alumno = cls.__new__(cls)
+        alumno.nombre = nombre
+        alumno.codigo = codigo
+        alumno.mac_int = mac_int
+        return alumno
+
+    @property
+    def mac(self):
+        return int_a_mac(self.mac_int)
+
+    @mac.setter
+    def mac(self, valor):
+        self.mac_int = mac_a_int(valor)
+
 class Curso:
+    # alumnos: códigos en un array ordenado (8 bytes por inscripción, búsqueda
+    # binaria). servidores: nombre -> tupla de servicios permitidos.
+    __slots__ = ("codigo", "estado", "nombre", "alumnos", "servidores")
+
     def __init__(self, codigo, estado, nombre, alumnos=None, servidores=None):
-        self.codigo = codigo
-        self.estado = estado
+        self.codigo = _intern(codigo)
+        self.estado = _intern(estado)
         self.nombre = nombre
-        self.alumnos = alumnos if alumnos else []
-        self.servidores = servidores if servidores else []
+        self.alumnos = array("q", sorted(set(alumnos))) if alumnos else array("q")
+        self.servidores = {}
+        for srv in servidores or []:
+            self.servidores[_intern(srv["nombre"])] = tuple(
+                _intern(svc.lower()) for svc in srv.get("servicios_permitidos", [])
+            )
+
+    def tiene_alumno(self, codigo):
+        i = bisect_left(self.alumnos, codigo)
+        return i < len(self.alumnos) and self.alumnos[i] == codigo
+
+    def inscribir(self, codigo):
+        i = bisect_left(self.alumnos, codigo)
+        if i < len(self.alumnos) and self.alumnos[i] == codigo:
+            return False
+        self.alumnos.insert(i, codigo)
+        return True
+
+    def desinscribir(self, codigo):
+        i = bisect_left(self.alumnos, codigo)
+        if i == len(self.alumnos) or self.alumnos[i] != codigo:
+            return False
+        del self.alumnos[i]
+        return True
 
 class Servicio:
+    __slots__ = ("nombre", "protocolo", "puerto")
+
     def __init__(self, nombre, protocolo, puerto):
-        self.nombre = nombre
-        self.protocolo = protocolo
+        self.nombre = _intern(nombre)
+        self.protocolo = _intern(protocolo)
         self.puerto = puerto
 
 class Servidor:
+    __slots__ = ("nombre", "ip", "servicios")
+
     def __init__(self, nombre, ip, servicios):
-        self.nombre = nombre
-        self.ip = ip
-        self.servicios = servicios
+        self.nombre = _intern(nombre)
+        self.ip = _intern(ip)
+        self.servicios = tuple(servicios)
 
 
 class Conexion:
-    def __init__(self, handler, alumno, servidor, servicio):
+    __slots__ = ("handler", "alumno", "servidor", "servicio", "flows", "compartidos", "hops", "generacion",
+                 "agregada")
+
+    def __init__(self, handler, alumno, servidor, servicio, compartidos=None, flows=None, hops=None,
+                 agregada=False):
         self.handler = handler
         self.alumno = alumno
         self.servidor = servidor
         self.servicio = servicio
+        # Flows propios instalados por build_route, como (nombre, switch)
+        self.flows = flows if flows else []
+        # Flows compartidos (ARP por switch) que usa la conexión
+        self.compartidos = compartidos if compartidos else []
+        # Ruta procesada: tupla de (dpid, in_port, out_port) por salto
+        self.hops = tuple(hops) if hops else ()
+        # Se incrementa en cada cambio de ruta para instalar los flows nuevos
+        # con otro nombre antes de borrar los anteriores
+        self.generacion = 0
+        # Modo agregado: fuera del switch del alumno usa flows compartidos
+        # por servidor/servicio (ver flow_agregado_de_hop)
+        self.agregada = agregada
+
+    @property
+    def prefijo(self):
+        return self.handler if self.generacion == 0 else f"{self.handler}_g{self.generacion}"
+
+    def enlaces(self):
+        # Enlaces entre switches que recorre la ruta (sin orientación)
+        return [enlace_normalizado(a[0], a[2], b[0], b[1]) for a, b in zip(self.hops, self.hops[1:])]
+
+
+# ==================== AUTORIZACIÓN =====================
+
+class IndiceAutorizacion:
+    # Índice de permisos (codigo, servidor, servicio) de los cursos DICTANDO.
+    # Cada permiso lleva la cuenta de cursos que lo otorgan, para poder
+    # actualizarlo al agregar/quitar alumnos o cursos sin recalcular todo.
+    def __init__(self):
+        self.permisos = {}
+        self.por_alumno = {}
+
+    @staticmethod
+    def tripletas_de_curso(curso, codigos=None):
+        codigos = curso.alumnos if codigos is None else codigos
+        for cod in codigos:
+            for nombre_servidor, servicios in curso.servidores.items():
+                for nombre_servicio in servicios:
+                    yield cod, nombre_servidor, nombre_servicio
+
+    def _sumar(self, tripleta, delta):
+        total = self.permisos.get(tripleta, 0) + delta
+        cod, servidor, servicio = tripleta
+        del_alumno = self.por_alumno.setdefault(cod, {})
+        if total > 0:
+            self.permisos[tripleta] = total
+            del_alumno[(servidor, servicio)] = total
+        else:
+            self.permisos.pop(tripleta, None)
+            del_alumno.pop((servidor, servicio), None)
+            if not del_alumno:
+                del self.por_alumno[cod]
+
+    def reconstruir(self, cursos):
+        self.permisos = {}
+        self.por_alumno = {}
+        for curso in cursos:
+            self.agregar_curso(curso)
+
+    def agregar_curso(self, curso):
+        if curso.estado == "DICTANDO":
+            for tripleta in self.tripletas_de_curso(curso):
+                self._sumar(tripleta, 1)
+
+    def quitar_curso(self, curso):
+        if curso.estado == "DICTANDO":
+            for tripleta in self.tripletas_de_curso(curso):
+                self._sumar(tripleta, -1)
+
+    def agregar_alumno(self, curso, codigo):
+        if curso.estado == "DICTANDO":
+            for tripleta in self.tripletas_de_curso(curso, [codigo]):
+                self._sumar(tripleta, 1)
+
+    def quitar_alumno(self, curso, codigo):
+        if curso.estado == "DICTANDO":
+            for tripleta in self.tripletas_de_curso(curso, [codigo]):
+                self._sumar(tripleta, -1)
+
+    def autorizado(self, codigo, servidor, servicio):
+        return (codigo, servidor, servicio.lower()) in self.permisos
+
+    def servicios_de(self, codigo):
+        # Pares (servidor, servicio) a los que puede acceder el alumno
+        return sorted(self.por_alumno.get(codigo, {}))
+
 
 
 # ==================== BASE DE DATOS =====================
-base_datos = {
-    "alumnos": [],
-    "cursos": [],
-    "servidores": [],
-    "conexiones": []
-}
+
+class BaseDatos:
+    # Almacén en memoria con índices hash por clave primaria (alumnos por
+    # código, cursos por código, servidores por nombre, conexiones por
+    # handler) y secundarios (MAC -> alumno, IP -> servidor). Los dicts
+    # conservan el orden de inserción, así que los listados no cambian.
+    # Toda modificación debe pasar por estos métodos para mantener los
+    # índices (y el de autorización) consistentes.
+    def __init__(self):
+        self.alumnos = {}
+        self.cursos = {}
+        self.servidores = {}
+        self.conexiones = {}
+        self.alumno_por_mac = {}
+        self.servidor_por_ip = {}
+        self.conexiones_por_alumno = {}
+        self.conexiones_por_enlace = {}
+        self.autorizacion = IndiceAutorizacion()
+        # Serializa los cambios de conexiones entre el menú, los hilos de fondo
+        # y la API HTTP; también se toma para copiar los índices de conexiones,
+        # nunca durante una llamada al controlador
+        self.lock = threading.RLock()
+        # Almacén persistente (AlmacenSQLite) al que se replica cada cambio
+        self.almacen = None
+
+    def _persistir(self, operacion, *args):
+        if self.almacen is not None:
+            getattr(self.almacen, operacion)(*args)
+
+    def cargar(self, alumnos, cursos, servidores):
+        # Reemplaza todo el roster; en el almacén se escribe de una sola vez.
+        # Las conexiones cuyo alumno, servidor y servicio siguen iguales se
+        # conservan, apuntando a los objetos nuevos. Las demás se descartan y
+        # se devuelven: quien llama debe borrar antes sus flows (ver
+        # conexiones_huerfanas).
+        with self.lock:
+            previas = list(self.conexiones.values())
+            descartadas = []
+            almacen, self.almacen = self.almacen, None
+            try:
+                self._cargar(alumnos, cursos, servidores)
+                for conexion in previas:
+                    equivalentes = self._equivalentes(conexion, self.alumnos, self.servidores)
+                    if equivalentes is None:
+                        descartadas.append(conexion)
+                        continue
+                    conexion.alumno, conexion.servidor, conexion.servicio = equivalentes
+                    self.agregar_conexion(conexion)
+            finally:
+                self.almacen = almacen
+            self._persistir("reemplazar", self.alumnos.values(), self.cursos.values(), self.servidores.values(),
+                            self.conexiones.values())
+        return descartadas
+
+    @staticmethod
+    def _equivalentes(conexion, alumnos, servidores):
+        # (alumno, servidor, servicio) de los dicts dados con la misma MAC, IP,
+        # protocolo y puerto que usan los flows de la conexión, o None
+        alumno = alumnos.get(conexion.alumno.codigo)
+        servidor = servidores.get(conexion.servidor.nombre)
+        if alumno is None or servidor is None:
+            return None
+        if alumno.mac_int != conexion.alumno.mac_int or servidor.ip != conexion.servidor.ip:
+            return None
+        anterior = conexion.servicio
+        servicio = next((s for s in servidor.servicios if s.nombre == anterior.nombre
+                         and s.protocolo == anterior.protocolo and str(s.puerto) == str(anterior.puerto)), None)
+        if servicio is None:
+            return None
+        return alumno, servidor, servicio
+
+    def conexiones_huerfanas(self, alumnos, servidores):
+        # Conexiones que cargar(alumnos, ..., servidores) descartaría
+        alumnos = {a.codigo: a for a in alumnos}
+        servidores = {s.nombre: s for s in servidores}
+        with self.lock:
+            return [c for c in self.conexiones.values() if self._equivalentes(c, alumnos, servidores) is None]
+
+    def _cargar(self, alumnos, cursos, servidores):
+        self.alumnos.clear()
+        self.cursos.clear()
+        self.servidores.clear()
+        self.conexiones.clear()
+        self.alumno_por_mac.clear()
+        self.servidor_por_ip.clear()
+        self.conexiones_por_alumno.clear()
+        self.conexiones_por_enlace.clear()
+        self.autorizacion.reconstruir([])
+        for alumno in alumnos:
+            self.agregar_alumno(alumno)
+        for servidor in servidores:
+            self.agregar_servidor(servidor)
+        for curso in cursos:
+            self.agregar_curso(curso)
+
+    # ---- alumnos ----
+    def alumno(self, codigo):
+        return self.alumnos.get(codigo)
+
+    def alumno_de_mac(self, mac):
+        try:
+            return self.alumno_por_mac.get(mac_a_int(mac))
+        except ValueError:
+            return None
+
+    def agregar_alumno(self, alumno):
+        # Código y MAC son únicos: los flows identifican al alumno por su MAC
+        if alumno.codigo in self.alumnos or alumno.mac_int in self.alumno_por_mac:
+            return False
+        self.alumnos[alumno.codigo] = alumno
+        self.alumno_por_mac[alumno.mac_int] = alumno
+        self._persistir("guardar_alumno", alumno)
+        return True
+
+    # ---- cursos ----
+    def curso(self, codigo):
+        return self.cursos.get(codigo)
+
+    def agregar_curso(self, curso):
+        if curso.codigo in self.cursos:
+            return False
+        self.cursos[curso.codigo] = curso
+        self.autorizacion.agregar_curso(curso)
+        self._persistir("guardar_curso", curso)
+        return True
+
+    def borrar_curso(self, codigo):
+        curso = self.cursos.pop(codigo, None)
+        if curso is not None:
+            self.autorizacion.quitar_curso(curso)
+            self._persistir("borrar_curso", codigo)
+        return curso
+
+    def cambiar_estado(self, curso, estado):
+        self.autorizacion.quitar_curso(curso)
+        curso.estado = _intern(estado)
+        self.autorizacion.agregar_curso(curso)
+        self._persistir("guardar_estado_curso", curso)
+
+    def inscribir(self, curso, codigo):
+        if not curso.inscribir(codigo):
+            return False
+        self.autorizacion.agregar_alumno(curso, codigo)
+        self._persistir("inscribir", curso, codigo)
+        return True
+
+    def desinscribir(self, curso, codigo):
+        if not curso.desinscribir(codigo):
+            return False
+        self.autorizacion.quitar_alumno(curso, codigo)
+        self._persistir("desinscribir", curso, codigo)
+        return True
+
+    def alumnos_de_curso(self, curso):
+        return [self.alumnos[cod] for cod in curso.alumnos if cod in self.alumnos]
+
+    # ---- servidores ----
+    def servidor(self, nombre):
+        return self.servidores.get(nombre)
+
+    def servidor_de_ip(self, ip):
+        return self.servidor_por_ip.get(ip)
+
+    def agregar_servidor(self, servidor):
+        if servidor.nombre in self.servidores:
+            return False
+        self.servidores[servidor.nombre] = servidor
+        self.servidor_por_ip[servidor.ip] = servidor
+        self._persistir("guardar_servidor", servidor)
+        return True
+
+    # ---- conexiones ----
+    def conexion(self, handler):
+        return self.conexiones.get(handler)
+
+    @staticmethod
+    def _indexar(indice, clave, conexion):
+        indice.setdefault(clave, {})[conexion.handler] = conexion
+
+    @staticmethod
+    def _desindexar(indice, clave, conexion):
+        grupo = indice.get(clave, {})
+        grupo.pop(conexion.handler, None)
+        if not grupo:
+            indice.pop(clave, None)
+
+    def _indexar_ruta(self, conexion):
+        for enlace in conexion.enlaces():
+            self._indexar(self.conexiones_por_enlace, enlace, conexion)
+
+    def _desindexar_ruta(self, conexion):
+        for enlace in conexion.enlaces():
+            self._desindexar(self.conexiones_por_enlace, enlace, conexion)
+
+    def agregar_conexion(self, conexion):
+        with self.lock:
+            self.conexiones[conexion.handler] = conexion
+            self._indexar(self.conexiones_por_alumno, conexion.alumno.codigo, conexion)
+            self._indexar_ruta(conexion)
+            self._persistir("guardar_conexion", conexion)
+
+    def borrar_conexion(self, handler):
+        with self.lock:
+            conexion = self.conexiones.pop(handler, None)
+            if conexion is not None:
+                self._desindexar(self.conexiones_por_alumno, conexion.alumno.codigo, conexion)
+                self._desindexar_ruta(conexion)
+                self._persistir("borrar_conexion", handler)
+            return conexion
+
+    def actualizar_ruta(self, conexion, hops, flows, compartidos):
+        with self.lock:
+            self._desindexar_ruta(conexion)
+            conexion.hops = tuple(hops)
+            conexion.flows = flows
+            conexion.compartidos = compartidos
+            self._indexar_ruta(conexion)
+            self._persistir("guardar_conexion", conexion)
+
+    def actualizar_flows(self, conexion, flows, compartidos=None):
+        # Flows que quedan registrados (p. ej. tras un borrado parcial)
+        with self.lock:
+            conexion.flows = flows
+            if compartidos is None:
+                self._persistir("guardar_flows", conexion)
+            else:
+                conexion.compartidos = compartidos
+                self._persistir("guardar_conexion", conexion)
+
+    def listar_conexiones(self):
+        with self.lock:
+            return list(self.conexiones.values())
+
+    def conexiones_de_enlace(self, enlace):
+        with self.lock:
+            return list(self.conexiones_por_enlace.get(enlace, {}).values())
+
+    def conexiones_de_alumno(self, codigo):
+        with self.lock:
+            return list(self.conexiones_por_alumno.get(codigo, {}).values())
+
+    def conexiones_de_curso(self, curso):
+        # Conexiones cuyo permiso (alumno, servidor, servicio) otorga el curso
+        encontradas = {}
+        with self.lock:
+            for cod, nombre_servidor, nombre_servicio in IndiceAutorizacion.tripletas_de_curso(curso):
+                for conexion in self.conexiones_por_alumno.get(cod, {}).values():
+                    if conexion.servidor.nombre == nombre_servidor and conexion.servicio.nombre.lower() == nombre_servicio:
+                        encontradas[conexion.handler] = conexion
+        return list(encontradas.values())
+
+    def conexiones_de_servidor(self, nombre):
+        with self.lock:
+            return [c for c in self.conexiones.values() if c.servidor.nombre == nombre]
+
+
+base_datos = BaseDatos()
+
+# ==================== PERSISTENCIA =====================
+
+# Archivo SQLite donde el menú guarda el estado (None = solo en memoria)
+ALMACEN_ARCHIVO = "estado.db"
+# Con estas extensiones, --estado del CLI usa el almacén SQLite en vez de la
+# instantánea JSON
+EXTENSIONES_ALMACEN = (".db", ".sqlite", ".sqlite3")
+
+ESQUEMA_ALMACEN = """
+CREATE TABLE IF NOT EXISTS alumnos (
+    codigo INTEGER NOT NULL UNIQUE,
+    nombre TEXT NOT NULL,
+    mac INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS servidores (
+    nombre TEXT NOT NULL UNIQUE,
+    ip TEXT NOT NULL,
+    servicios TEXT NOT NULL                 -- JSON [[nombre, protocolo, puerto]]
+);
+CREATE TABLE IF NOT EXISTS cursos (
+    codigo TEXT NOT NULL UNIQUE,
+    estado TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    servidores TEXT NOT NULL,               -- JSON {servidor: [servicios permitidos]}
+    alumnos BLOB NOT NULL                   -- array('q') ordenado de códigos
+);
+CREATE TABLE IF NOT EXISTS flows_compartidos (
+    nombre TEXT NOT NULL UNIQUE,
+    flow TEXT NOT NULL                      -- JSON del flow
+);
+CREATE TABLE IF NOT EXISTS conexiones (
+    handler TEXT NOT NULL UNIQUE,
+    alumno INTEGER NOT NULL,
+    servidor TEXT NOT NULL,
+    servicio TEXT NOT NULL,
+    generacion INTEGER NOT NULL,
+    hops TEXT NOT NULL,                     -- JSON [[dpid, in_port, out_port]]
+    flows TEXT NOT NULL,                    -- JSON [[nombre, switch]]
+    compartidos TEXT NOT NULL,              -- JSON [nombre en flows_compartidos]
+    agregada INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class AlmacenSQLite:
+    # Copia durable de base_datos. BaseDatos le replica cada cambio con una
+    # escritura pequeña (una transacción por operación); el roster completo
+    # solo se reescribe al importar. Las filas se leen en orden de inserción
+    # (rowid) para que los listados queden igual tras reiniciar. Las
+    # inscripciones se guardan como el array del curso y los flows como una
+    # lista por conexión, para que restaurar lea pocas filas.
+    def __init__(self, nombre_archivo):
+        import sqlite3
+
+        self.nombre_archivo = nombre_archivo
+        self.db = sqlite3.connect(nombre_archivo, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(ESQUEMA_ALMACEN)
+        columnas = {fila[1] for fila in self.db.execute("PRAGMA table_info(conexiones)")}
+        if "agregada" not in columnas:
+            # Almacenes creados antes del modo agregado
+            self.db.execute("ALTER TABLE conexiones ADD COLUMN agregada INTEGER NOT NULL DEFAULT 0")
+        self._lock = threading.Lock()
+
+    def cerrar(self):
+        with self._lock:
+            self.db.close()
+
+    def _escribir(self, *sentencias):
+        # [(sql, parámetros)] en una transacción; parámetros como lista = executemany
+        with self._lock, self.db:
+            for sql, parametros in sentencias:
+                if isinstance(parametros, list):
+                    self.db.executemany(sql, parametros)
+                else:
+                    self.db.execute(sql, parametros)
+
+    # ---- filas ----
+    @staticmethod
+    def _fila_alumno(alumno):
+        return alumno.codigo, alumno.nombre, alumno.mac_int
+
+    @staticmethod
+    def _fila_servidor(servidor):
+        return servidor.nombre, servidor.ip, json.dumps([[s.nombre, s.protocolo, s.puerto] for s in servidor.servicios])
+
+    @staticmethod
+    def _fila_curso(curso):
+        return (curso.codigo, curso.estado, curso.nombre,
+                json.dumps({n: list(s) for n, s in curso.servidores.items()}), curso.alumnos.tobytes())
+
+    @staticmethod
+    def _fila_conexion(conexion):
+        return (conexion.handler, conexion.alumno.codigo, conexion.servidor.nombre, conexion.servicio.nombre,
+                conexion.generacion, json.dumps([list(h) for h in conexion.hops]),
+                json.dumps([list(f) for f in conexion.flows]), json.dumps([f["name"] for f in conexion.compartidos]),
+                int(conexion.agregada))
+
+    @staticmethod
+    def _filas_compartidos(conexion):
+        return [(f["name"], json.dumps(f)) for f in conexion.compartidos]
+
+    # ---- escrituras ----
+    def reemplazar(self, alumnos, cursos, servidores, conexiones=()):
+        conexiones = list(conexiones)
+        self._escribir(
+            ("DELETE FROM conexiones", ()),
+            ("DELETE FROM flows_compartidos", ()),
+            ("DELETE FROM cursos", ()),
+            ("DELETE FROM servidores", ()),
+            ("DELETE FROM alumnos", ()),
+            ("INSERT INTO alumnos VALUES (?, ?, ?)", [self._fila_alumno(a) for a in alumnos]),
+            ("INSERT INTO servidores VALUES (?, ?, ?)", [self._fila_servidor(s) for s in servidores]),
+            ("INSERT INTO cursos VALUES (?, ?, ?, ?, ?)", [self._fila_curso(c) for c in cursos]),
+            ("INSERT OR IGNORE INTO flows_compartidos VALUES (?, ?)",
+             [fila for c in conexiones for fila in self._filas_compartidos(c)]),
+            ("INSERT INTO conexiones VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+             [self._fila_conexion(c) for c in conexiones]),
+        )
+
+    def guardar_alumno(self, alumno):
+        self._escribir(("INSERT INTO alumnos VALUES (?, ?, ?) ON CONFLICT (codigo) "
+                        "DO UPDATE SET nombre = excluded.nombre, mac = excluded.mac", self._fila_alumno(alumno)))
+
+    def guardar_servidor(self, servidor):
+        self._escribir(("INSERT INTO servidores VALUES (?, ?, ?) ON CONFLICT (nombre) "
+                        "DO UPDATE SET ip = excluded.ip, servicios = excluded.servicios", self._fila_servidor(servidor)))
+
+    def guardar_curso(self, curso):
+        self._escribir(("INSERT INTO cursos VALUES (?, ?, ?, ?, ?) ON CONFLICT (codigo) DO UPDATE SET "
+                        "estado = excluded.estado, nombre = excluded.nombre, servidores = excluded.servidores, "
+                        "alumnos = excluded.alumnos", self._fila_curso(curso)))
+
+    def guardar_estado_curso(self, curso):
+        self._escribir(("UPDATE cursos SET estado = ? WHERE codigo = ?", (curso.estado, curso.codigo)))
+
+    def guardar_inscripciones(self, curso):
+        self._escribir(("UPDATE cursos SET alumnos = ? WHERE codigo = ?", (curso.alumnos.tobytes(), curso.codigo)))
+
+    def inscribir(self, curso, codigo):
+        self.guardar_inscripciones(curso)
+
+    def desinscribir(self, curso, codigo):
+        self.guardar_inscripciones(curso)
+
+    def borrar_curso(self, codigo):
+        self._escribir(("DELETE FROM cursos WHERE codigo = ?", (codigo,)))
+
+    def guardar_conexion(self, conexion):
+        self._escribir(
+            ("INSERT OR IGNORE INTO flows_compartidos VALUES (?, ?)", self._filas_compartidos(conexion)),
+            ("INSERT INTO conexiones VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (handler) DO UPDATE SET "
+             "generacion = excluded.generacion, hops = excluded.hops, flows = excluded.flows, "
+             "compartidos = excluded.compartidos, agregada = excluded.agregada", self._fila_conexion(conexion)),
+        )
+
+    def guardar_flows(self, conexion):
+        self._escribir(("UPDATE conexiones SET flows = ? WHERE handler = ?",
+                        (json.dumps([list(f) for f in conexion.flows]), conexion.handler)))
+
+    def borrar_conexion(self, handler):
+        self._escribir(("DELETE FROM conexiones WHERE handler = ?", (handler,)))
+
+    # ---- lectura ----
+    def vacio(self):
+        with self._lock:
+            return not any(self.db.execute(f"SELECT 1 FROM {tabla} LIMIT 1").fetchone()
+                           for tabla in ("alumnos", "cursos", "servidores"))
+
+    def cargar_en(self, bd):
+        # Reconstruye bd desde el almacén sin volver a escribirle nada.
+        # Devuelve la cantidad de conexiones descartadas por no tener ya
+        # alumno, servidor o servicio.
+        with self._lock:
+            alumnos = [Alumno.desde_int(nombre, codigo, mac) for codigo, nombre, mac
+                       in self.db.execute("SELECT codigo, nombre, mac FROM alumnos ORDER BY rowid")]
+            servidores = [Servidor(nombre, ip, [Servicio(*svc) for svc in json.loads(servicios)])
+                          for nombre, ip, servicios
+                          in self.db.execute("SELECT nombre, ip, servicios FROM servidores ORDER BY rowid")]
+            cursos = []
+            for codigo, estado, nombre, srvs, inscritos in self.db.execute(
+                    "SELECT codigo, estado, nombre, servidores, alumnos FROM cursos ORDER BY rowid"):
+                curso = Curso(codigo, estado, nombre, None,
+                              [{"nombre": n, "servicios_permitidos": svcs} for n, svcs in json.loads(srvs).items()])
+                curso.alumnos.frombytes(inscritos)
+                cursos.append(curso)
+            compartidos = {nombre: json.loads(flow) for nombre, flow
+                           in self.db.execute("SELECT nombre, flow FROM flows_compartidos")}
+            filas = self.db.execute("SELECT handler, alumno, servidor, servicio, generacion, hops, flows, "
+                                    "compartidos, agregada FROM conexiones ORDER BY rowid").fetchall()
+
+        almacen, bd.almacen = bd.almacen, None
+        descartadas = []
+        try:
+            bd.cargar(alumnos, cursos, servidores)
+            for handler, cod, nombre_servidor, nombre_servicio, generacion, hops, flows, nombres, agregada in filas:
+                alumno = bd.alumno(cod)
+                servidor = bd.servidor(nombre_servidor)
+                servicio = servidor and next((s for s in servidor.servicios if s.nombre == nombre_servicio), None)
+                if alumno is None or servicio is None:
+                    descartadas.append(handler)
+                    continue
+                conexion = Conexion(handler, alumno, servidor, servicio,
+                                    [compartidos[n] for n in json.loads(nombres) if n in compartidos],
+                                    [tuple(f) for f in json.loads(flows)], [tuple(h) for h in json.loads(hops)],
+                                    bool(agregada))
+                conexion.generacion = generacion
+                bd.agregar_conexion(conexion)
+        finally:
+            bd.almacen = almacen
+        for handler in descartadas:
+            self.borrar_conexion(handler)
+        return len(descartadas)
+
+
+def abrir_almacen(nombre_archivo, verbose=True):
+    # Conecta base_datos al almacén. Si este ya tiene datos se restauran
+    # (arranque en caliente); si está vacío se le copia lo que haya en memoria.
+    inicio = time.perf_counter()
+    almacen = AlmacenSQLite(nombre_archivo)
+    if almacen.vacio():
+        almacen.reemplazar(base_datos.alumnos.values(), base_datos.cursos.values(), base_datos.servidores.values(),
+                           base_datos.conexiones.values())
+        base_datos.almacen = almacen
+        return almacen
+    descartadas = almacen.cargar_en(base_datos)
+    base_datos.almacen = almacen
+    flows_compartidos.reconstruir(base_datos.conexiones.values())
+    if verbose:
+        print(f"Estado restaurado de '{nombre_archivo}': {len(base_datos.alumnos)} alumnos, "
+              f"{len(base_datos.cursos)} cursos, {len(base_datos.servidores)} servidores, "
+              f"{len(base_datos.conexiones)} conexiones en {time.perf_counter() - inicio:.2f} s.")
+    if descartadas:
+        print(f"⚠️ {descartadas} conexiones del almacén no corresponden al roster y se descartaron.")
+    return almacen
+
+
+def cerrar_almacen():
+    if base_datos.almacen is not None:
+        base_datos.almacen.cerrar()
+        base_datos.almacen = None
+
+
+# ==================== MÉTRICAS =====================
+
+# Límites (s) de los buckets de los histogramas de latencia
+METRICAS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Si se define, al salir del programa se vuelcan las métricas en este archivo
+# en formato de texto de Prometheus
+METRICAS_ARCHIVO = None
+
+# Rutas REST con parámetros en la URL: se agrupan bajo una sola etiqueta
+PATRON_ENDPOINT_RUTA = re.compile(r"^/wm/topology/route/.*$")
+
+
+class Histograma:
+    # Cuentas acumuladas por bucket (formato de Prometheus: valor <= límite)
+    __slots__ = ("cuentas", "suma", "total", "maximo")
+
+    def __init__(self):
+        self.cuentas = [0] * (len(METRICAS_BUCKETS) + 1)     # el último es +Inf
+        self.suma = 0.0
+        self.total = 0
+        self.maximo = 0.0
+
+    def observar(self, segundos):
+        self.cuentas[bisect_left(METRICAS_BUCKETS, segundos)] += 1
+        self.suma += segundos
+        self.total += 1
+        if segundos > self.maximo:
+            self.maximo = segundos
+
+    def percentil(self, p):
+        # Límite superior del bucket donde cae el percentil (cota, no valor exacto)
+        if not self.total:
+            return None
+        objetivo = self.total * p / 100
+        acumulado = 0
+        for limite, cuenta in zip(METRICAS_BUCKETS, self.cuentas):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return min(limite, self.maximo)
+        return self.maximo
+
+
+class EstadisticaEndpoint:
+    __slots__ = ("llamadas", "errores", "bytes_enviados", "bytes_recibidos", "latencia")
+
+    def __init__(self):
+        self.llamadas = 0
+        self.errores = 0
+        self.bytes_enviados = 0
+        self.bytes_recibidos = 0
+        self.latencia = Histograma()
+
+
+class Metricas:
+    # Contadores y latencias de cada llamada al controlador, por (método,
+    # endpoint), duración de las fases de creación de conexiones y llamadas
+    # ahorradas por LlamadasAgrupadas.
+    def __init__(self):
+        self.endpoints = {}         # (metodo, endpoint) -> EstadisticaEndpoint
+        self.fases = {}             # nombre -> Histograma
+        self.agrupadas = {}         # tipo -> llamadas que esperaron a otra igual
+        self.desde = time.time()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(ruta):
+        ruta = ruta.split("?", 1)[0]
+        if PATRON_ENDPOINT_RUTA.match(ruta):
+            return "/wm/topology/route"
+        return ruta
+
+    def registrar_llamada(self, metodo, ruta, segundos, response, enviados=0):
+        clave = (metodo, self.endpoint(ruta))
+        recibidos = len(response.content) if response is not None else 0
+        error = response is None or response.status_code >= 400
+        with self._lock:
+            estadistica = self.endpoints.get(clave)
+            if estadistica is None:
+                estadistica = self.endpoints[clave] = EstadisticaEndpoint()
+            estadistica.llamadas += 1
+            estadistica.errores += error
+            estadistica.bytes_enviados += enviados
+            estadistica.bytes_recibidos += recibidos
+            estadistica.latencia.observar(segundos)
+
+    def registrar_fase(self, nombre, segundos):
+        with self._lock:
+            histograma = self.fases.get(nombre)
+            if histograma is None:
+                histograma = self.fases[nombre] = Histograma()
+            histograma.observar(segundos)
+
+    def registrar_agrupada(self, tipo):
+        with self._lock:
+            self.agrupadas[tipo] = self.agrupadas.get(tipo, 0) + 1
+
+    @contextmanager
+    def fase(self, nombre):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar_fase(nombre, time.perf_counter() - inicio)
+
+    def latencia_promedio(self, metodo, ruta):
+        # Segundos promedio medidos para el endpoint, o None si no hay llamadas
+        with self._lock:
+            estadistica = self.endpoints.get((metodo, self.endpoint(ruta)))
+            if estadistica is None or not estadistica.latencia.total:
+                return None
+            return estadistica.latencia.suma / estadistica.latencia.total
+
+    def reiniciar(self):
+        with self._lock:
+            self.endpoints = {}
+            self.fases = {}
+            self.agrupadas = {}
+            self.desde = time.time()
+
+    def instantanea(self):
+        # Copia en dict (serializable a JSON) de todas las métricas
+        def latencias(h):
+            return {
+                "promedio_ms": h.suma / h.total * 1000 if h.total else None,
+                "p50_ms": h.percentil(50) * 1000 if h.total else None,
+                "p99_ms": h.percentil(99) * 1000 if h.total else None,
+                "max_ms": h.maximo * 1000,
+            }
+
+        with self._lock:
+            endpoints = {
+                f"{metodo} {endpoint}": {
+                    "llamadas": e.llamadas,
+                    "errores": e.errores,
+                    "bytes_enviados": e.bytes_enviados,
+                    "bytes_recibidos": e.bytes_recibidos,
+                    **latencias(e.latencia),
+                }
+                for (metodo, endpoint), e in sorted(self.endpoints.items())
+            }
+            fases = {nombre: {"veces": h.total, **latencias(h)} for nombre, h in sorted(self.fases.items())}
+            agrupadas = dict(sorted(self.agrupadas.items()))
+        return {"desde": self.desde, "endpoints": endpoints, "fases": fases, "agrupadas": agrupadas}
+
+    def resumen(self):
+        datos = self.instantanea()
+        lineas = [f"Métricas desde {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(datos['desde']))}"]
+        if datos["endpoints"]:
+            lineas.append(f"{'Endpoint':45s} {'llamadas':>8s} {'errores':>7s} {'enviado':>10s} {'recibido':>10s} "
+                          f"{'prom ms':>8s} {'p50 ms':>7s} {'p99 ms':>7s} {'máx ms':>8s}")
+            for nombre, e in datos["endpoints"].items():
+                lineas.append(f"{nombre:45s} {e['llamadas']:8d} {e['errores']:7d} {e['bytes_enviados']:10d} "
+                              f"{e['bytes_recibidos']:10d} {e['promedio_ms']:8.2f} {e['p50_ms']:7.2f} "
+                              f"{e['p99_ms']:7.2f} {e['max_ms']:8.2f}")
+        if datos["fases"]:
+            lineas.append(f"{'Fase':45s} {'veces':>8s} {'prom ms':>8s} {'p50 ms':>7s} {'p99 ms':>7s} {'máx ms':>8s}")
+            for nombre, f in datos["fases"].items():
+                lineas.append(f"{nombre:45s} {f['veces']:8d} {f['promedio_ms']:8.2f} {f['p50_ms']:7.2f} "
+                              f"{f['p99_ms']:7.2f} {f['max_ms']:8.2f}")
+        if datos["agrupadas"]:
+            lineas.append("Llamadas agrupadas: " + ", ".join(f"{tipo} {n}" for tipo, n in datos["agrupadas"].items()))
+        if len(lineas) == 1:
+            lineas.append("📭 Aún no hay llamadas registradas.")
+        return "\n".join(lineas)
+
+    def prometheus(self):
+        # Texto en el formato de exposición de Prometheus
+        def histograma(nombre, etiquetas, h):
+            filas = []
+            acumulado = 0
+            for limite, cuenta in zip(METRICAS_BUCKETS, h.cuentas):
+                acumulado += cuenta
+                filas.append(f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+            filas.append(f'{nombre}_bucket{{{etiquetas},le="+Inf"}} {h.total}')
+            filas.append(f"{nombre}_sum{{{etiquetas}}} {h.suma}")
+            filas.append(f"{nombre}_count{{{etiquetas}}} {h.total}")
+            return filas
+
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            fases = sorted(self.fases.items())
+            agrupadas = sorted(self.agrupadas.items())
+            lineas = []
+            contadores = (
+                ("controller_requests_total", "Llamadas REST al controlador", "llamadas"),
+                ("controller_errors_total", "Llamadas sin respuesta o con estado HTTP >= 400", "errores"),
+                ("controller_request_bytes_total", "Bytes enviados en el cuerpo de las peticiones", "bytes_enviados"),
+                ("controller_response_bytes_total", "Bytes recibidos en el cuerpo de las respuestas", "bytes_recibidos"),
+            )
+            for nombre, ayuda, campo in contadores:
+                lineas.append(f"# HELP {nombre} {ayuda}")
+                lineas.append(f"# TYPE {nombre} counter")
+                for (metodo, endpoint), e in endpoints:
+                    lineas.append(f'{nombre}{{method="{metodo}",endpoint="{endpoint}"}} {getattr(e, campo)}')
+            lineas.append("# HELP controller_request_duration_seconds Latencia de las llamadas al controlador")
+            lineas.append("# TYPE controller_request_duration_seconds histogram")
+            for (metodo, endpoint), e in endpoints:
+                lineas.extend(histograma("controller_request_duration_seconds",
+                                         f'method="{metodo}",endpoint="{endpoint}"', e.latencia))
+            lineas.append("# HELP phase_duration_seconds Duración de las fases de creación de conexiones")
+            lineas.append("# TYPE phase_duration_seconds histogram")
+            for nombre, h in fases:
+                lineas.extend(histograma("phase_duration_seconds", f'phase="{nombre}"', h))
+            lineas.append("# HELP coalesced_calls_total Llamadas que reutilizaron el resultado de otra igual en curso")
+            lineas.append("# TYPE coalesced_calls_total counter")
+            for tipo, n in agrupadas:
+                lineas.append(f'coalesced_calls_total{{kind="{tipo}"}} {n}')
+        return "\n".join(lineas) + "\n"
+
+    def exportar_prometheus(self, nombre_archivo):
+        # Se escribe a un temporal y se renombra para que un lector (p. ej. el
+        # textfile collector de node_exporter) nunca vea el archivo a medias
+        temporal = f"{nombre_archivo}.tmp"
+        with open(temporal, "w") as f:
+            f.write(self.prometheus())
+        os.replace(temporal, nombre_archivo)
+
+
+metricas = Metricas()
 
 # ==================== FUNCIONES API =====================
 
@@ -52,40 +941,427 @@ CONTROLLER_IP = "10.20.12.86"
 CONTROLLER_PORT = "8080"
 BASE_URL = f"http://{CONTROLLER_IP}:{CONTROLLER_PORT}"
 
+# Parámetros del cliente REST hacia Floodlight
+CONTROLLER_TIMEOUT = (3.05, 10)     # (conexión, lectura) en segundos
+CONTROLLER_RETRIES = 3              # solo para llamadas idempotentes (GET/DELETE)
+CONTROLLER_BACKOFF = 0.3
+CONTROLLER_POOL_SIZE = 10
+
+
+class ClienteFloodlight:
+    # Sesión HTTP compartida (keep-alive) hacia el controlador. Todas las
+    # llamadas REST del programa pasan por aquí.
+    def __init__(self, base_url, timeout=CONTROLLER_TIMEOUT, reintentos=CONTROLLER_RETRIES,
+                 backoff=CONTROLLER_BACKOFF, pool=CONTROLLER_POOL_SIZE):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self.pool = pool
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Se crea en la primera llamada: así importar el módulo no carga requests
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    from urllib3.util.retry import Retry
+
+                    retry = Retry(
+                        total=self.reintentos,
+                        backoff_factor=self.backoff,
+                        status_forcelist=(502, 503, 504),
+                        allowed_methods=frozenset({"GET", "DELETE"}),
+                        raise_on_status=False,
+                    )
+                    adapter = HTTPAdapter(pool_connections=self.pool, pool_maxsize=self.pool, max_retries=retry)
+                    session = requests.Session()
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def request(self, metodo, ruta, **kwargs):
+        import requests
+
+        kwargs.setdefault("timeout", self.timeout)
+        inicio = time.perf_counter()
+        try:
+            response = self.session.request(metodo, f"{self.base_url}{ruta}", **kwargs)
+        except requests.RequestException as e:
+            metricas.registrar_llamada(metodo, ruta, time.perf_counter() - inicio, None)
+            print(f"❌ Error de comunicación con el controlador ({metodo} {ruta}): {e}")
+            return None
+        cuerpo = response.request.body
+        metricas.registrar_llamada(metodo, ruta, time.perf_counter() - inicio, response,
+                                   len(cuerpo) if cuerpo else 0)
+        return response
+
+    def get(self, ruta, **kwargs):
+        return self.request("GET", ruta, **kwargs)
+
+    def post(self, ruta, **kwargs):
+        return self.request("POST", ruta, **kwargs)
+
+    def delete(self, ruta, **kwargs):
+        return self.request("DELETE", ruta, **kwargs)
+
+    def push_flow(self, flow):
+        return self.post("/wm/staticflowpusher/json", json=flow)
+
+    def delete_flow(self, nombre):
+        return self.delete("/wm/staticflowpusher/json", json={"name": nombre})
+
+    def cerrar(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+controller = ClienteFloodlight(BASE_URL)
+
+
+def configurar_controlador(base_url, **kwargs):
+    # Apunta el programa a otro controlador (p. ej. floodlight_fake.py) y
+    # descarta lo que se tenía en caché del anterior
+    global BASE_URL, controller
+    controller.cerrar()
+    BASE_URL = base_url
+    controller = ClienteFloodlight(base_url, **kwargs)
+    device_cache.invalidar()
+    route_cache.rutas.clear()
+    route_cache.digest = None
+
+
+class LlamadasAgrupadas:
+    # Agrupa llamadas simultáneas con la misma clave (single-flight): la
+    # primera ejecuta la función y las que llegan mientras sigue en curso
+    # esperan y reciben el mismo resultado en vez de repetir la llamada. El
+    # primer elemento de la clave es el tipo que se cuenta en las métricas.
+    def __init__(self):
+        self.en_curso = {}          # clave -> [evento, resultado, excepción]
+        self._lock = threading.Lock()
+
+    def ejecutar(self, clave, funcion, *args, **kwargs):
+        with self._lock:
+            vuelo = self.en_curso.get(clave)
+            primera = vuelo is None
+            if primera:
+                vuelo = self.en_curso[clave] = [threading.Event(), None, None]
+        if not primera:
+            metricas.registrar_agrupada(clave[0])
+            vuelo[0].wait()
+        else:
+            try:
+                vuelo[1] = funcion(*args, **kwargs)
+            except BaseException as e:
+                vuelo[2] = e
+            finally:
+                with self._lock:
+                    del self.en_curso[clave]
+                vuelo[0].set()
+        if vuelo[2] is not None:
+            raise vuelo[2]
+        return vuelo[1]
+
+
+llamadas_agrupadas = LlamadasAgrupadas()
+
+
+# Segundos que se reutiliza la tabla /wm/device/ antes de volver a pedirla
+DEVICE_CACHE_TTL = 30
+# Ante una MAC o IP que no está en la caché se recarga la tabla, pero no más
+# de una vez cada tantos segundos
+DEVICE_MISS_INTERVAL = 1
+
+
+class CacheDispositivos:
+    # Copia local de /wm/device/ con índices MAC -> attachment points,
+    # IP -> MAC y MAC -> IPs. Se refresca al vencer el TTL o al invalidarla.
+    def __init__(self, ttl=DEVICE_CACHE_TTL):
+        self.ttl = ttl
+        self.aps_por_mac = {}
+        self.mac_por_ip = {}
+        self.ips_por_mac = {}
+        self.cargado_en = None
+
+    def invalidar(self):
+        self.cargado_en = None
+
+    def vigente(self):
+        return self.cargado_en is not None and time.monotonic() - self.cargado_en < self.ttl
+
+    def cargar(self, dispositivos):
+        aps_por_mac = {}
+        mac_por_ip = {}
+        ips_por_mac = {}
+        for host in dispositivos:
+            macs = [m.lower() for m in host.get("mac", []) if m]
+            if not macs:
+                continue
+            aps = [(ap["switchDPID"], ap["port"]) for ap in host.get("attachmentPoint", [])]
+            ips = [ip for ip in host.get("ipv4", []) if ip]
+            for mac in macs:
+                aps_por_mac[mac] = aps
+                ips_por_mac[mac] = ips
+            for ip in ips:
+                mac_por_ip.setdefault(ip, macs[0])
+        self.aps_por_mac = aps_por_mac
+        self.mac_por_ip = mac_por_ip
+        self.ips_por_mac = ips_por_mac
+        self.cargado_en = time.monotonic()
+
+    def refrescar(self):
+        response = controller.get("/wm/device/")
+        if response is None:
+            return False
+        if response.status_code != 200:
+            print(f"[{response.status_code}] Error al obtener dispositivos.")
+            print(f"Respuesta: {response.text}")
+            return False
+        self.cargar(response.json())
+        return True
+
+    def asegurar(self):
+        # Si varios hilos la encuentran vencida, solo uno pide /wm/device/
+        if self.vigente():
+            return True
+        return llamadas_agrupadas.ejecutar(("dispositivos", id(self)), self.refrescar)
+
+    def refrescar_si_falta(self):
+        # Para hosts conectados después de la última carga. Devuelve True si
+        # la tabla se recargó (aquí o en otro hilo) y vale la pena buscar otra vez
+        if self.cargado_en is not None and time.monotonic() - self.cargado_en < DEVICE_MISS_INTERVAL:
+            return False
+        return llamadas_agrupadas.ejecutar(("dispositivos", id(self)), self.refrescar)
+
+    def mac_de_ip(self, ip):
+        if not self.asegurar():
+            return None
+        mac = self.mac_por_ip.get(ip)
+        if mac is None and self.refrescar_si_falta():
+            mac = self.mac_por_ip.get(ip)
+        return mac
+
+    def ips_de_mac(self, mac_address):
+        if not self.asegurar():
+            return []
+        return self.ips_por_mac.get(mac_address.lower(), [])
+
+
+device_cache = CacheDispositivos()
+
 
 def get_attachment_points(mac_address):
     if mac_address is None:
         print("❌ La dirección MAC proporcionada es None.")
         return None, None
 
-    url = f"{BASE_URL}/wm/device/"
-    response = requests.get(url)
-
-    if response.status_code == 200:
-        data = response.json()
-        for host in data:
-            if mac_address.lower() in [m.lower() for m in host.get("mac", []) if m]:
-                aps = host.get("attachmentPoint", [])
-                if aps:
-                    punto = aps[0]
-                    return punto["switchDPID"], punto["port"]
-                else:
-                    print(f"⚠️ La MAC {mac_address} no tiene attachmentPoint.")
+    if not device_cache.asegurar():
+        return None, None
+
+    aps = device_cache.aps_por_mac.get(mac_address.lower())
+    if aps is None and device_cache.refrescar_si_falta():
+        aps = device_cache.aps_por_mac.get(mac_address.lower())
+    if aps is None:
         print(f"⚠️ La MAC {mac_address} no fue encontrada.")
+    elif not aps:
+        print(f"⚠️ La MAC {mac_address} no tiene attachmentPoint.")
     else:
-        print(f"[{response.status_code}] Error al obtener dispositivos.")
-        print(f"Respuesta: {response.text}")
-    
+        return aps[0]
+
     return None, None
 
-def get_route(src_dpid, src_port, dst_dpid, dst_port):
-    url = f"{BASE_URL}/wm/topology/route/{src_dpid}/{src_port}/{dst_dpid}/{dst_port}/json"
-    print(f"Obteniendo ruta de {src_dpid}:{src_port} a {dst_dpid}:{dst_port}...")
-    response = requests.get(url)
-    if response.status_code == 200:
-        ruta = response.json()
-        return [(hop["switch"], hop["port"]["portNumber"]) for hop in ruta]
-    return []
+# Intervalo mínimo (s) entre consultas a /wm/topology/links/json para
+# comprobar si la topología cambió
+TOPOLOGY_POLL_INTERVAL = 5
+
+
+class CacheRutas:
+    # Rutas ya calculadas por el controlador, por par de switches (src_dpid,
+    # dst_dpid): el camino entre switches no depende del puerto del host, así
+    # que solo se reemplazan el primer y último salto. Se vacía cuando cambia
+    # el digest de los enlaces.
+    def __init__(self, intervalo=TOPOLOGY_POLL_INTERVAL):
+        self.intervalo = intervalo
+        self.rutas = {}
+        self.digest = None
+        self.revisado_en = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidaciones = 0
+        self._lock = threading.Lock()
+
+    def invalidar(self):
+        with self._lock:
+            self.rutas.clear()
+            self.invalidaciones += 1
+
+    def revisar_topologia(self, forzar=False):
+        # La consulta se hace sin el lock: revisado_en se marca antes, así los
+        # demás hilos siguen usando las rutas en vez de esperar o repetirla
+        with self._lock:
+            ahora = time.monotonic()
+            if not forzar and self.revisado_en is not None and ahora - self.revisado_en < self.intervalo:
+                return
+            self.revisado_en = ahora
+        response = controller.get("/wm/topology/links/json")
+        if response is None or response.status_code != 200:
+            return
+        enlaces = sorted(json.dumps(e, sort_keys=True) for e in response.json())
+        digest = hashlib.sha1("\n".join(enlaces).encode()).hexdigest()
+        with self._lock:
+            if digest != self.digest:
+                if self.digest is not None:
+                    self.rutas.clear()
+                    self.invalidaciones += 1
+                self.digest = digest
+
+    def obtener(self, clave):
+        self.revisar_topologia()
+        with self._lock:
+            ruta = self.rutas.get(clave)
+            if ruta is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return ruta
+
+    def guardar(self, clave, ruta):
+        with self._lock:
+            self.rutas[clave] = ruta
+
+    def resumen(self):
+        return f"Caché de rutas: {self.hits} aciertos, {self.misses} fallos, {self.invalidaciones} invalidaciones"
+
+
+route_cache = CacheRutas()
+
+
+def get_route(src_dpid, src_port, dst_dpid, dst_port, verbose=True):
+    # Las consultas simultáneas por el mismo par de switches comparten una
+    # sola llamada al controlador; cada una pone luego sus propios puertos
+    clave = (src_dpid, dst_dpid)
+    ruta = route_cache.obtener(clave)
+    if ruta is None:
+        ruta = llamadas_agrupadas.ejecutar(("ruta",) + clave, _consultar_ruta,
+                                           src_dpid, src_port, dst_dpid, dst_port, verbose)
+    if not ruta:
+        return []
+    ruta = list(ruta)
+    ruta[0] = (src_dpid, src_port)
+    ruta[-1] = (dst_dpid, dst_port)
+    return ruta
+
+
+def _consultar_ruta(src_dpid, src_port, dst_dpid, dst_port, verbose):
+    url = f"/wm/topology/route/{src_dpid}/{src_port}/{dst_dpid}/{dst_port}/json"
+    if verbose:
+        print(f"Obteniendo ruta de {src_dpid}:{src_port} a {dst_dpid}:{dst_port}...")
+    response = controller.get(url)
+    if response is not None and response.status_code == 200:
+        ruta = tuple((hop["switch"], hop["port"]["portNumber"]) for hop in response.json())
+        if ruta:
+            route_cache.guardar((src_dpid, dst_dpid), ruta)
+        return ruta
+    return ()
+
+class FlowsCompartidos:
+    # Flows idénticos para todas las conexiones de un switch (p. ej. ARP) con
+    # conteo de referencias: se instalan con la primera conexión que los usa
+    # y se borran cuando se libera la última.
+    def __init__(self):
+        self.flows = {}
+        self.refs = {}
+        self._lock = threading.Lock()
+        # Un lock por flow: la llamada REST de un flow no bloquea a los demás
+        self._locks = {}
+
+    def _lock_de(self, nombre):
+        with self._lock:
+            return self._locks.setdefault(nombre, threading.Lock())
+
+    def adquirir(self, flow):
+        # Devuelve el flow registrado (compartido por todas las conexiones),
+        # None si no se pudo instalar o False si ya hay uno con ese nombre y
+        # otras acciones (no se comparte).
+        nombre = flow["name"]
+        with self._lock_de(nombre):
+            registrado = self.flows.get(nombre)
+            if registrado is not None and self.refs.get(nombre, 0) > 0 and registrado["actions"] != flow["actions"]:
+                return False
+            if self.refs.get(nombre, 0) == 0:
+                r = controller.push_flow(flow)
+                if r is None or r.status_code != 200:
+                    detalle = "sin respuesta del controlador" if r is None else f"{r.status_code} - {r.text}"
+                    print(f"❌ Error al instalar flow {nombre} en {flow['switch']}: {detalle}")
+                    return None
+            with self._lock:
+                self.flows.setdefault(nombre, flow)
+                self.refs[nombre] = self.refs.get(nombre, 0) + 1
+                return self.flows[nombre]
+
+    def liberar(self, nombre):
+        # Devuelve False si era la última referencia y no se pudo borrar: el
+        # flow queda registrado con esa referencia, que quien llama conserva
+        # para reintentar.
+        with self._lock_de(nombre):
+            with self._lock:
+                refs = self.refs.get(nombre, 0) - 1
+                if refs > 0:
+                    self.refs[nombre] = refs
+                    return True
+            r = controller.delete_flow(nombre)
+            if r is not None and r.status_code == 200:
+                with self._lock:
+                    self.refs.pop(nombre, None)
+                    self.flows.pop(nombre, None)
+                return True
+            detalle = "sin respuesta del controlador" if r is None else f"{r.status_code} - {r.text}"
+            print(f"❌ Error al borrar flow compartido {nombre}: {detalle}")
+            return False
+
+    def reconstruir(self, conexiones):
+        # Recalcula las referencias a partir de las conexiones registradas,
+        # sin llamar al controlador.
+        with self._lock:
+            self.refs = {}
+            self.flows = {}
+            for conexion in conexiones:
+                for flow in conexion.compartidos:
+                    self.refs[flow["name"]] = self.refs.get(flow["name"], 0) + 1
+                    self.flows.setdefault(flow["name"], flow)
+
+
+flows_compartidos = FlowsCompartidos()
+
+
+# Modo agregado por defecto para las conexiones nuevas y prioridad de sus
+# flows compartidos (menor que la de los flows por alumno, 100)
+AGREGAR_FLOWS = False
+PRIORIDAD_AGREGADA = "90"
+
+
+def flow_arp_compartido(dpid):
+    return {
+        "switch": dpid,
+        "name": f"arp_{dpid.replace(':', '')}",
+        "priority": "300",
+        "eth_type": "0x0806",
+        "active": "true",
+        "actions": "normal"
+    }
+
+
+def enlace_normalizado(dpid_a, puerto_a, dpid_b, puerto_b):
+    puerto_a = int(puerto_a) if str(puerto_a).isdigit() else puerto_a
+    puerto_b = int(puerto_b) if str(puerto_b).isdigit() else puerto_b
+    return tuple(sorted(((dpid_a.lower(), puerto_a), (dpid_b.lower(), puerto_b)), key=str))
+
 
 def procesar_ruta(route):
     hops_procesados = []
@@ -96,82 +1372,893 @@ def procesar_ruta(route):
         hops_procesados.append((dpid, in_port, out_port))
     return hops_procesados
 
-def build_route(route, alumno, servidor, servicio, handler):
+def flows_de_hop(i, dpid, in_port, out_port, alumno, servidor, servicio, handler):
     protocolo = servicio.protocolo.lower()
     puerto = servicio.puerto
     mac_src = alumno.mac
     ip_dst = servidor.ip
-    mac_dst = get_mac_from_ip(ip_dst)
-    print(f"MAC destino para {ip_dst}: {mac_dst}")
+    ip_proto = "0x06" if protocolo == "tcp" else "0x11"
 
+    # Ida: host -> servidor
+    flow_fwd = {
+        "switch": dpid,
+        "name": f"{handler}_fwd_{i}",
+        "priority": "100",
+        "eth_type": "0x0800",
+        "ipv4_dst": ip_dst,
+        "eth_src": mac_src,
+        "ip_proto": ip_proto,
+        "tp_dst": str(puerto),
+        "in_port": in_port,
+        "active": "true",
+        "actions": f"output={out_port}"
+    }
+
+    # Retorno: servidor -> host
+    flow_rev = {
+        "switch": dpid,
+        "name": f"{handler}_rev_{i}",
+        "priority": "100",
+        "eth_type": "0x0800",
+        "ipv4_src": ip_dst,
+        "eth_dst": mac_src,
+        "ip_proto": ip_proto,
+        "tp_src": str(puerto),
+        "in_port": out_port,
+        "active": "true",
+        "actions": f"output={in_port}"
+    }
+    return [flow_fwd, flow_rev]
+
+
+def flow_agregado_de_hop(dpid, in_port, out_port, servidor, servicio):
+    # Ida sin la MAC del alumno: la comparten todas las conexiones al mismo
+    # servidor/servicio que entran por el mismo puerto de este switch. El
+    # nombre identifica el match (no la salida): si otra conexión necesita
+    # otra salida para el mismo match, FlowsCompartidos no lo comparte y esa
+    # conexión usa su flow propio. El retorno siempre es por alumno (eth_dst):
+    # desde el servidor todas las conexiones entran por el mismo puerto y se
+    # separan según el alumno. El permiso se sigue aplicando en el switch del
+    # alumno. Prioridad menor que la de los flows propios.
+    protocolo = servicio.protocolo.lower()
     ip_proto = "0x06" if protocolo == "tcp" else "0x11"
-    hops = procesar_ruta(route)
+    return {
+        "switch": dpid,
+        "name": f"agg_{dpid.replace(':', '')}_{in_port}_{servidor.nombre}_{servicio.nombre}_fwd",
+        "priority": PRIORIDAD_AGREGADA,
+        "eth_type": "0x0800",
+        "ipv4_dst": servidor.ip,
+        "ip_proto": ip_proto,
+        "tp_dst": str(servicio.puerto),
+        "in_port": in_port,
+        "active": "true",
+        "actions": f"output={out_port}"
+    }
+
+
+def flows_de_conexion(conexion):
+    # Flows propios que build_route instala para la ruta de la conexión (en
+    # modo agregado, sin la ida de los saltos que usan el flow compartido)
+    compartidos = {f["name"] for f in conexion.compartidos}
+    flows = []
+    for i, (dpid, in_port, out_port) in enumerate(conexion.hops):
+        propios = flows_de_hop(i, dpid, in_port, out_port, conexion.alumno,
+                               conexion.servidor, conexion.servicio, conexion.prefijo)
+        if conexion.agregada and i > 0:
+            agregado = flow_agregado_de_hop(dpid, in_port, out_port, conexion.servidor, conexion.servicio)
+            if agregado["name"] in compartidos:
+                propios = propios[1:]
+        flows.extend(propios)
+    return flows
+
+
+def build_route(route, alumno, servidor, servicio, handler, verbose=True, agregada=False):
+    ip_dst = servidor.ip
+    if verbose:
+        with metricas.fase("build_route.mac_destino"):
+            mac_dst = get_mac_from_ip(ip_dst)
+        print(f"MAC destino para {ip_dst}: {mac_dst}")
+    with metricas.fase("build_route.procesar_ruta"):
+        hops = procesar_ruta(route)
+    with metricas.fase("build_route.instalar_flows"):
+        return instalar_hops(hops, alumno, servidor, servicio, handler, verbose, agregada)
+
+
+def instalar_hops(hops, alumno, servidor, servicio, handler, verbose=True, agregada=False):
+    instalados = []
+    fallidos = 0
+    compartidos = []
 
     for i, (dpid, in_port, out_port) in enumerate(hops):
-        # Ida: host -> servidor
-        flow_fwd = {
-            "switch": dpid,
-            "name": f"{handler}_fwd_{i}",
-            "priority": "100",
-            "eth_type": "0x0800",
-            "ipv4_dst": ip_dst,
-            "eth_src": mac_src,
-            "ip_proto": ip_proto,
-            "tp_dst": str(puerto),
-            "in_port": in_port,
-            "active": "true",
-            "actions": f"output={out_port}"
-        }
+        propios = flows_de_hop(i, dpid, in_port, out_port, alumno, servidor, servicio, handler)
+        # ARP: un único flow por switch compartido entre conexiones; en modo
+        # agregado también la ida fuera del switch del alumno, que reemplaza
+        # a la propia salvo que otra conexión use ese match con otra salida
+        por_compartir = [flow_arp_compartido(dpid)]
+        if agregada and i > 0:
+            por_compartir.append(flow_agregado_de_hop(dpid, in_port, out_port, servidor, servicio))
+        for flow in por_compartir:
+            if any(f["name"] == flow["name"] for f in compartidos):
+                continue
+            registrado = flows_compartidos.adquirir(flow)
+            if registrado:
+                compartidos.append(registrado)
+                if flow["name"].startswith("agg_"):
+                    propios = propios[1:]
+            elif registrado is None:
+                fallidos += 1
+
+        # Instalar ida y retorno
+        for flow in propios:
+            r = controller.push_flow(flow)
+            if r is None:
+                fallidos += 1
+                print(f"❌ Error al instalar flow {flow['name']} en {dpid}: sin respuesta del controlador")
+            elif r.status_code != 200:
+                fallidos += 1
+                print(f"❌ Error al instalar flow {flow['name']} en {dpid}: {r.status_code} - {r.text}")
+            else:
+                instalados.append((flow["name"], dpid))
+                if verbose:
+                    print(f"✅ Flow {flow['name']} instalado correctamente en {dpid}")
 
-        # Retorno: servidor -> host
-        flow_rev = {
-            "switch": dpid,
-            "name": f"{handler}_rev_{i}",
-            "priority": "100",
-            "eth_type": "0x0800",
-            "ipv4_src": ip_dst,
-            "eth_dst": mac_src,
-            "ip_proto": ip_proto,
-            "tp_src": str(puerto),
-            "in_port": out_port,
-            "active": "true",
-            "actions": f"output={in_port}"
-        }
+    return instalados, fallidos, compartidos
 
-        # Eliminar ARP anterior
-        requests.delete(f"{BASE_URL}/wm/staticflowpusher/json", json={"name": f"{handler}_arp_{i}"})
-
-        # ARP
-        flow_arp = {
-            "switch": dpid,
-            "name": f"{handler}_arp_{i}",
-            "priority": "300",
-            "eth_type": "0x0806",
-            "active": "true",
-            "actions": "normal"
-        }
 
-        # Instalar todos
-        for flow in [flow_fwd, flow_rev, flow_arp]:
-            r = requests.post(f"{BASE_URL}/wm/staticflowpusher/json", json=flow)
-            if r.status_code != 200:
-                print(f"❌ Error al instalar flow {flow['name']} en {dpid}: {r.status_code} - {r.text}")
+def get_mac_from_ip(ip_destino):
+    return device_cache.mac_de_ip(ip_destino)
+
+
+def crear_conexion(alumno, servidor, servicio, verbose=True, agregada=None):
+    # Resuelve attachment points y ruta, instala los flows y registra la
+    # conexión. Devuelve (conexion, None) o (None, mensaje_de_error).
+    # agregada=None usa AGREGAR_FLOWS. Si otro hilo ya está creando el mismo
+    # handler, espera y devuelve su resultado en vez de instalarlo dos veces.
+    if agregada is None:
+        agregada = AGREGAR_FLOWS
+    handler = f"{alumno.codigo}_{servidor.nombre}_{servicio.nombre}"
+    return llamadas_agrupadas.ejecutar(("conexion", handler), _crear_conexion,
+                                       handler, alumno, servidor, servicio, verbose, agregada)
+
+
+def _crear_conexion(handler, alumno, servidor, servicio, verbose, agregada):
+    if base_datos.conexion(handler):
+        return None, f"Ya existe una conexión con handler {handler}."
+    with metricas.fase("conexion.attachment_points"):
+        ap1 = get_attachment_points(alumno.mac)
+        ap2 = get_attachment_points(get_mac_from_ip(servidor.ip))
+    if ap1[0] is None or ap2[0] is None:
+        return None, "No se pudieron obtener puntos de conexión."
+
+    with metricas.fase("conexion.ruta"):
+        ruta = get_route(ap1[0], ap1[1], ap2[0], ap2[1], verbose=verbose)
+    if not ruta:
+        return None, "Ruta no encontrada."
+    if verbose:
+        print(f"Ruta: {ruta}")
+
+    with metricas.fase("conexion.build_route"):
+        flows, fallidos, compartidos = build_route(ruta, alumno, servidor, servicio, handler, verbose=verbose,
+                                                   agregada=agregada)
+
+    if fallidos:
+        # Conexión incompleta: se deshace lo instalado en vez de registrarla
+        pendientes = len(borrar_flows(flows))
+        pendientes += sum(1 for flow in compartidos if not flows_compartidos.liberar(flow["name"]))
+        error = f"{fallidos} flows no se pudieron instalar."
+        if pendientes:
+            error += f" Además quedaron {pendientes} flows sin borrar (se limpian al reconciliar)."
+        return None, error
+
+    conexion = Conexion(handler, alumno, servidor, servicio, compartidos, flows, procesar_ruta(ruta), agregada)
+    base_datos.agregar_conexion(conexion)
+    return conexion, None
+
+
+def conectar(cod_alumno, nombre_servidor, nombre_servicio, verbose=True):
+    # Valida alumno, servidor, permiso y servicio antes de crear la conexión.
+    # Devuelve (conexion, None) o (None, mensaje_de_error).
+    alumno = base_datos.alumno(int(cod_alumno)) if str(cod_alumno).isdigit() else None
+    servidor = base_datos.servidor(nombre_servidor)
+    if not alumno or not servidor:
+        return None, "❌ Alumno o servidor no encontrado."
+
+    nombre_servicio = nombre_servicio.lower()
+    if not base_datos.autorizacion.autorizado(alumno.codigo, nombre_servidor, nombre_servicio):
+        return None, "Alumno NO autorizado."
+
+    servicio = next((s for s in servidor.servicios if s.nombre.lower() == nombre_servicio), None)
+    if not servicio:
+        return None, "Servicio no encontrado."
+
+    return crear_conexion(alumno, servidor, servicio, verbose=verbose)
+
+
+# Hilos que borran flows en paralelo al eliminar conexiones
+TEARDOWN_WORKERS = 8
+
+
+def borrar_flows(flows, workers=TEARDOWN_WORKERS):
+    # Borra en paralelo los flows [(nombre, switch)] y devuelve los que
+    # fallaron como [(nombre, switch, detalle)]
+    fallidos = []
+    if not flows:
+        return fallidos
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futuros = {pool.submit(controller.delete_flow, nombre): (nombre, switch) for nombre, switch in flows}
+        for futuro in as_completed(futuros):
+            nombre, switch = futuros[futuro]
+            r = futuro.result()
+            if r is None:
+                fallidos.append((nombre, switch, "sin respuesta del controlador"))
+            elif r.status_code != 200:
+                fallidos.append((nombre, switch, f"{r.status_code} - {r.text}"))
+    return fallidos
+
+
+def eliminar_conexiones(conexiones, workers=TEARDOWN_WORKERS):
+    # Borra en paralelo exactamente los flows registrados en cada conexión,
+    # libera sus flows compartidos y la quita de la base de datos. Antes de
+    # llamar al controlador la conexión se saca de la base de datos y sube su
+    # generación, así un reenrutamiento en curso la ve cambiada y deshace su
+    # ruta nueva. Si algún flow (propio o compartido) no se pudo borrar, la
+    # conexión vuelve a registrarse solo con esos flows para poder reintentar.
+    # Devuelve {handler: [(nombre, switch, detalle)]}.
+    conexiones = list(conexiones)
+    fallos = {c.handler: [] for c in conexiones}
+    reclamadas = []
+    with base_datos.lock:
+        for conexion in conexiones:
+            if base_datos.conexion(conexion.handler) is conexion:
+                base_datos.borrar_conexion(conexion.handler)
+                conexion.generacion += 1
+                reclamadas.append((conexion, list(conexion.flows), list(conexion.compartidos)))
+    duenos = {nombre: c.handler for c, flows, _ in reclamadas for nombre, _ in flows}
+    for nombre, switch, detalle in borrar_flows([f for _, flows, _ in reclamadas for f in flows], workers):
+        fallos[duenos[nombre]].append((nombre, switch, detalle))
+
+    for conexion, _, compartidos in reclamadas:
+        pendientes = fallos[conexion.handler]
+        conexion.flows = [(nombre, switch) for nombre, switch, _ in pendientes]
+        if pendientes:
+            # Sin borrar los propios no se sueltan los compartidos
+            conexion.compartidos = compartidos
+        else:
+            conexion.compartidos = [flow for flow in compartidos if not flows_compartidos.liberar(flow["name"])]
+            pendientes.extend((flow["name"], flow["switch"], "flow compartido sin borrar")
+                              for flow in conexion.compartidos)
+        if not pendientes:
+            continue
+        for nombre, switch, detalle in pendientes:
+            print(f"❌ No se pudo borrar {nombre} en {switch}: {detalle}")
+        with base_datos.lock:
+            if base_datos.conexion(conexion.handler) is None:
+                base_datos.agregar_conexion(conexion)
             else:
-                print(f"✅ Flow {flow['name']} instalado correctamente en {dpid}")
+                print(f"⚠️ El handler {conexion.handler} ya tiene otra conexión; "
+                      f"los flows pendientes se limpian al reconciliar.")
+    return fallos
 
 
+# ==================== PROVISIÓN MASIVA =====================
 
+# Hilos que empujan flows en paralelo durante la provisión masiva
+BULK_WORKERS = 8
 
 
-def get_mac_from_ip(ip_destino):
-    url = f"{BASE_URL}/wm/device/"
-    response = requests.get(url)
-    if response.status_code == 200:
-        devices = response.json()
-        for device in devices:
-            if ip_destino in device.get("ipv4", []):
-                return device.get("mac", [])[0]
-    return None
+def conexiones_autorizadas(codigo_curso=None):
+    # Expande los cursos DICTANDO (uno o todos) en tripletas
+    # (alumno, servidor, servicio) autorizadas, sin repetir handlers.
+    tripletas = {}
+    if codigo_curso:
+        cursos = [base_datos.curso(codigo_curso)] if base_datos.curso(codigo_curso) else []
+    else:
+        cursos = base_datos.cursos.values()
+    for curso in cursos:
+        if curso.estado != "DICTANDO":
+            continue
+        for cod, nombre_servidor, nombre_servicio in IndiceAutorizacion.tripletas_de_curso(curso):
+            handler = f"{cod}_{nombre_servidor}_{nombre_servicio}"
+            tripletas.setdefault(handler, (cod, nombre_servidor, nombre_servicio))
+    return tripletas
+
+
+def provisionar_curso(codigo_curso=None, workers=BULK_WORKERS, agregada=None):
+    tripletas = conexiones_autorizadas(codigo_curso)
+
+    # Una sola descarga de la tabla de dispositivos para todo el lote
+    device_cache.asegurar()
+
+    resultados = []
+    pendientes = []
+    for handler, (cod, nombre_servidor, nombre_servicio) in tripletas.items():
+        if base_datos.conexion(handler):
+            resultados.append((handler, True, "ya existía"))
+            continue
+        alumno = base_datos.alumno(cod)
+        servidor = base_datos.servidor(nombre_servidor)
+        servicio = None
+        if servidor:
+            servicio = next((s for s in servidor.servicios if s.nombre.lower() == nombre_servicio.lower()), None)
+        if not alumno or not servidor or not servicio:
+            resultados.append((handler, False, "alumno, servidor o servicio no encontrado"))
+            continue
+        pendientes.append((handler, alumno, servidor, servicio))
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futuros = {
+            pool.submit(crear_conexion, alumno, servidor, servicio, False, agregada): handler
+            for handler, alumno, servidor, servicio in pendientes
+        }
+        for futuro in as_completed(futuros):
+            handler = futuros[futuro]
+            try:
+                conexion, error = futuro.result()
+            except Exception as e:
+                conexion, error = None, str(e)
+            if conexion is None:
+                resultados.append((handler, False, error))
+            else:
+                resultados.append((handler, True, "creada"))
+    duracion = time.perf_counter() - inicio
+
+    for handler, ok, detalle in resultados:
+        print(f"{'✅' if ok else '❌'} {handler}: {detalle}")
+    creadas = sum(1 for _, ok, detalle in resultados if ok and detalle == "creada")
+    fallidas = sum(1 for _, ok, _ in resultados if not ok)
+    ritmo = creadas / duracion if duracion > 0 else 0.0
+    print(f"Provisión terminada: {creadas} creadas, {fallidas} fallidas, "
+          f"{len(resultados) - creadas - fallidas} ya existían en {duracion:.2f} s ({ritmo:.1f} conexiones/s).")
+    print(route_cache.resumen())
+    return resultados
+
+
+# ==================== RECONCILIACIÓN =====================
+
+# Nombres de los flows que instala este programa (propios y compartidos);
+# incluye los ARP por conexión de versiones anteriores para limpiarlos.
+PATRON_FLOWS_PROPIOS = re.compile(r"(_(fwd|rev|arp)_\d+|^arp_[0-9a-f]+|^agg_.*_(fwd|rev))$")
+
+# Campos del flow que no forman parte del match
+_CAMPOS_NO_MATCH = {"switch", "name", "priority", "active", "actions"}
+
+
+def _valor_normalizado(valor):
+    # Floodlight devuelve "0x0x800", "0x6", "22", etc.; se comparan como enteros
+    texto = str(valor).strip().lower()
+    if texto.startswith("0x"):
+        hexa = texto
+        while hexa.startswith("0x"):
+            hexa = hexa[2:]
+        try:
+            return int(hexa, 16)
+        except ValueError:
+            return texto
+    if texto.isdigit():
+        return int(texto)
+    return texto
+
+
+def _acciones_normalizadas(acciones):
+    normalizadas = []
+    for accion in str(acciones).lower().split(","):
+        accion = accion.strip()
+        if accion.startswith("output="):
+            accion = accion[len("output="):]
+        normalizadas.append(accion)
+    return tuple(normalizadas)
+
+
+def _match_normalizado(match):
+    proto = _valor_normalizado(match.get("ip_proto", "")) if "ip_proto" in match else None
+    capa4 = {6: "tcp", 17: "udp"}.get(proto, "tp")
+    normalizado = {}
+    for campo, valor in match.items():
+        if campo in ("tp_src", "tp_dst"):
+            campo = f"{capa4}_{campo[3:]}"
+        normalizado[campo] = _valor_normalizado(valor)
+    return tuple(sorted(normalizado.items()))
+
+
+def firma_flow(flow):
+    # Firma comparable de un flow en el formato de /wm/staticflowpusher/json
+    match = {k: v for k, v in flow.items() if k not in _CAMPOS_NO_MATCH}
+    return (flow["switch"].lower(), _valor_normalizado(flow.get("priority", 32768)),
+            _match_normalizado(match), _acciones_normalizadas(flow.get("actions", "")))
+
+
+def firma_instalada(dpid, entrada):
+    # Firma de una entrada de /wm/staticflowpusher/list/all/json
+    acciones = entrada.get("instructions", {}).get("instruction_apply_actions", {}).get("actions", "")
+    return (dpid.lower(), _valor_normalizado(entrada.get("priority", 32768)),
+            _match_normalizado(entrada.get("match", {})), _acciones_normalizadas(acciones))
+
+
+def flows_instalados():
+    # Un único GET con todos los flows estáticos: {nombre: (dpid, entrada)}
+    response = controller.get("/wm/staticflowpusher/list/all/json")
+    if response is None or response.status_code != 200:
+        return None
+    instalados = {}
+    for dpid, entradas in response.json().items():
+        for entrada in entradas:
+            for nombre, detalle in entrada.items():
+                instalados[nombre] = (dpid, detalle)
+    return instalados
+
+
+def flows_deseados():
+    # {nombre: flow} según las conexiones registradas
+    deseados = {}
+    for conexion in base_datos.conexiones.values():
+        for flow in flows_de_conexion(conexion):
+            deseados[flow["name"]] = flow
+        for flow in conexion.compartidos:
+            deseados[flow["name"]] = flow
+    return deseados
+
+
+def reconciliar(aplicar=True, workers=TEARDOWN_WORKERS):
+    # Compara el estado deseado con lo instalado en el controlador y aplica
+    # solo la diferencia: empuja lo que falta o cambió y borra los flows
+    # propios que ya no corresponden a ninguna conexión.
+    inicio = time.perf_counter()
+    instalados = flows_instalados()
+    if instalados is None:
+        print("❌ No se pudo obtener la lista de flows instalados.")
+        return None
+    deseados = flows_deseados()
+
+    faltantes = [f for nombre, f in deseados.items() if nombre not in instalados]
+    cambiados = [f for nombre, f in deseados.items()
+                 if nombre in instalados and firma_flow(f) != firma_instalada(*instalados[nombre])]
+    huerfanos = [(nombre, dpid) for nombre, (dpid, _) in instalados.items()
+                 if nombre not in deseados and PATRON_FLOWS_PROPIOS.search(nombre)]
+    print(f"Reconciliación: {len(deseados)} flows deseados, {len(instalados)} instalados -> "
+          f"{len(faltantes)} faltantes, {len(cambiados)} distintos, {len(huerfanos)} huérfanos.")
+
+    errores = []
+    if aplicar and (faltantes or cambiados or huerfanos):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futuros = {pool.submit(controller.push_flow, f): (f["name"], f["switch"]) for f in faltantes + cambiados}
+            futuros.update({pool.submit(controller.delete_flow, nombre): (nombre, dpid) for nombre, dpid in huerfanos})
+            for futuro in as_completed(futuros):
+                r = futuro.result()
+                if r is None or r.status_code != 200:
+                    nombre, dpid = futuros[futuro]
+                    detalle = "sin respuesta del controlador" if r is None else f"{r.status_code} - {r.text}"
+                    errores.append((nombre, dpid, detalle))
+                    print(f"❌ {nombre} en {dpid}: {detalle}")
+
+        # Las conexiones quedan registradas con todos sus flows propios
+        fallidos = {nombre for nombre, _, _ in errores}
+        for conexion in list(base_datos.conexiones.values()):
+            base_datos.actualizar_flows(conexion, [(f["name"], f["switch"]) for f in flows_de_conexion(conexion)
+                                                   if f["name"] not in fallidos or f["name"] in instalados])
+        flows_compartidos.reconstruir(base_datos.conexiones.values())
+
+    print(f"Reconciliación {'aplicada' if aplicar else 'calculada'} en {time.perf_counter() - inicio:.2f} s "
+          f"({len(errores)} errores).")
+    return {"faltantes": faltantes, "cambiados": cambiados, "huerfanos": huerfanos, "errores": errores}
+
+
+# ==================== REENRUTAMIENTO =====================
+
+# Segundos entre revisiones del vigilante de topología y dispositivos
+WATCH_INTERVAL = 10
+
+
+def reenrutar(conexion):
+    # Recalcula la ruta de la conexión y, si cambió, instala la nueva (con
+    # otra generación de nombres) antes de borrar la anterior. Las llamadas
+    # al controlador se hacen sin base_datos.lock; solo el cambio de ruta lo
+    # toma, tras comprobar que nadie borró o reenrutó la conexión mientras.
+    ap1 = get_attachment_points(conexion.alumno.mac)
+    ap2 = get_attachment_points(get_mac_from_ip(conexion.servidor.ip))
+    if ap1[0] is None or ap2[0] is None:
+        return False, "sin puntos de conexión"
+    ruta = get_route(ap1[0], ap1[1], ap2[0], ap2[1], verbose=False)
+    if not ruta:
+        return False, "sin ruta"
+    hops = tuple(procesar_ruta(ruta))
+    if hops == conexion.hops:
+        return True, "sin cambios"
+
+    generacion = conexion.generacion + 1
+    prefijo = f"{conexion.handler}_g{generacion}"
+    flows, fallidos, compartidos = instalar_hops(hops, conexion.alumno, conexion.servidor,
+                                                 conexion.servicio, prefijo, verbose=False,
+                                                 agregada=conexion.agregada)
+    with base_datos.lock:
+        vigente = base_datos.conexion(conexion.handler) is conexion and conexion.generacion == generacion - 1
+        if not fallidos and vigente:
+            flows_viejos = conexion.flows
+            compartidos_viejos = conexion.compartidos
+            conexion.generacion = generacion
+            base_datos.actualizar_ruta(conexion, hops, flows, compartidos)
+    if fallidos or not vigente:
+        # Se deshace la ruta nueva y se mantiene la anterior
+        for nombre, switch, detalle in borrar_flows(flows):
+            print(f"❌ No se pudo borrar {nombre} en {switch}: {detalle}")
+        for flow in compartidos:
+            flows_compartidos.liberar(flow["name"])
+        if fallidos:
+            return False, f"{fallidos} flows de la ruta nueva fallaron"
+        return False, "la conexión cambió o se borró durante el reenrutamiento"
+
+    for nombre, switch, detalle in borrar_flows(flows_viejos):
+        print(f"❌ No se pudo borrar {nombre} en {switch}: {detalle}")
+    # Los compartidos que no se pudieron borrar siguen a cargo de la
+    # conexión y se reintentan al borrarla
+    retenidos = [flow for flow in compartidos_viejos if not flows_compartidos.liberar(flow["name"])]
+    if retenidos:
+        with base_datos.lock:
+            if base_datos.conexion(conexion.handler) is conexion and conexion.generacion == generacion:
+                base_datos.actualizar_flows(conexion, conexion.flows, conexion.compartidos + retenidos)
+            else:
+                for flow in retenidos:
+                    print(f"❌ {flow['name']} quedó sin borrar y la conexión ya no existe; reconciliar lo borra.")
+    return True, "reenrutada"
+
+
+class VigilanteRed:
+    # Hilo de fondo que revisa enlaces y tabla de dispositivos. Solo se
+    # reenrutan las conexiones que pasan por un enlace caído o cuyo alumno o
+    # servidor cambió de attachment point.
+    def __init__(self, intervalo=WATCH_INTERVAL):
+        self.intervalo = intervalo
+        self.enlaces = None
+        self.aps = None
+        self._parar = threading.Event()
+        self._hilo = None
+
+    def activo(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def iniciar(self):
+        if self.activo():
+            return
+        self.enlaces = None
+        self.aps = None
+        self.revisar()          # línea base
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._ciclo, name="vigilante-red", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._parar.set()
+        if self._hilo is not None:
+            self._hilo.join()
+            self._hilo = None
+
+    def _ciclo(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.revisar()
+            except Exception as e:
+                print(f"[vigilante] Error al revisar la red: {e}")
+
+    def _enlaces_actuales(self):
+        response = controller.get("/wm/topology/links/json")
+        if response is None or response.status_code != 200:
+            return None
+        return {enlace_normalizado(e["src-switch"], e["src-port"], e["dst-switch"], e["dst-port"])
+                for e in response.json()}
+
+    def _aps_actuales(self):
+        if not device_cache.refrescar():
+            return None
+        return {mac: aps[0] for mac, aps in device_cache.aps_por_mac.items() if aps}
+
+    def revisar(self):
+        afectadas = {}
+
+        enlaces = self._enlaces_actuales()
+        if enlaces is not None:
+            if self.enlaces is not None and enlaces != self.enlaces:
+                route_cache.revisar_topologia(forzar=True)
+                for enlace in self.enlaces - enlaces:
+                    for conexion in base_datos.conexiones_de_enlace(enlace):
+                        afectadas[conexion.handler] = conexion
+            self.enlaces = enlaces
+
+        aps = self._aps_actuales()
+        if aps is not None:
+            if self.aps is not None:
+                for mac, ap in self.aps.items():
+                    if aps.get(mac) == ap:
+                        continue
+                    alumno = base_datos.alumno_de_mac(mac)
+                    if alumno is not None:
+                        for conexion in base_datos.conexiones_de_alumno(alumno.codigo):
+                            afectadas[conexion.handler] = conexion
+                    for ip in device_cache.ips_de_mac(mac):
+                        servidor = base_datos.servidor_de_ip(ip)
+                        if servidor is not None:
+                            for conexion in base_datos.conexiones_de_servidor(servidor.nombre):
+                                afectadas[conexion.handler] = conexion
+            self.aps = aps
+
+        for handler, conexion in afectadas.items():
+            if base_datos.conexion(handler) is not conexion:
+                continue
+            ok, detalle = reenrutar(conexion)
+            print(f"[vigilante] {'✅' if ok else '❌'} {handler}: {detalle}")
+        return afectadas
+
+
+vigilante = VigilanteRed()
+
+
+# ==================== REVOCACIÓN =====================
+
+def revocar_no_autorizadas(candidatas):
+    # Elimina (en paralelo) las conexiones candidatas que ya no tienen permiso
+    revocadas = [c for c in candidatas
+                 if not base_datos.autorizacion.autorizado(c.alumno.codigo, c.servidor.nombre, c.servicio.nombre)]
+    if not revocadas:
+        return []
+    inicio = time.perf_counter()
+    fallos = eliminar_conexiones(revocadas)
+    con_fallos = sum(1 for pendientes in fallos.values() if pendientes)
+    print(f"🔒 {len(revocadas) - con_fallos} conexiones revocadas, {con_fallos} con errores "
+          f"en {time.perf_counter() - inicio:.2f} s.")
+    return revocadas
+
+
+# El lock solo cubre el cambio de índices y la lista de candidatas; el
+# borrado de flows se hace después, sin él.
+
+def desinscribir_alumno(curso, codigo):
+    with base_datos.lock:
+        if not base_datos.desinscribir(curso, codigo):
+            return False
+        candidatas = base_datos.conexiones_de_alumno(codigo)
+    revocar_no_autorizadas(candidatas)
+    return True
+
+
+def eliminar_curso(codigo):
+    with base_datos.lock:
+        curso = base_datos.curso(codigo)
+        if curso is None:
+            return None
+        candidatas = base_datos.conexiones_de_curso(curso)
+        base_datos.borrar_curso(codigo)
+    revocar_no_autorizadas(candidatas)
+    return curso
+
+
+def cambiar_estado_curso(codigo, estado):
+    # DICTANDO -> INACTIVO revoca las conexiones del curso;
+    # INACTIVO -> DICTANDO provisiona todas las autorizadas.
+    curso = base_datos.curso(codigo)
+    if curso is None or estado not in ("DICTANDO", "INACTIVO"):
+        return False
+    if curso.estado == estado:
+        return True
+    with base_datos.lock:
+        candidatas = base_datos.conexiones_de_curso(curso)
+        base_datos.cambiar_estado(curso, estado)
+    if estado == "INACTIVO":
+        revocar_no_autorizadas(candidatas)
+    if estado == "DICTANDO":
+        provisionar_curso(codigo)
+    return True
+
+
+# ==================== PLANIFICACIÓN =====================
+
+# Entradas por switch que se asumen disponibles para flows (TCAM); ajustable
+FLOW_TABLE_CAPACITY = 2000
+# Latencia (s) por llamada REST que se asume si aún no hay métricas medidas
+PLAN_LATENCIA = 0.005
+
+
+class SnapshotRed:
+    # Copia offline de /wm/device/ y /wm/topology/links/json. Calcula rutas
+    # de menor cantidad de saltos (como Floodlight) con un BFS por switch de
+    # destino que se reutiliza para todos los orígenes.
+    def __init__(self, dispositivos, enlaces):
+        self.dispositivos = dispositivos
+        self.enlaces = enlaces
+        self.cache = CacheDispositivos(ttl=float("inf"))
+        self.cache.cargar(dispositivos)
+        self.vecinos = {}       # dpid -> [(puerto, vecino, puerto_vecino)]
+        for e in enlaces:
+            a, pa, b, pb = e["src-switch"].lower(), e["src-port"], e["dst-switch"].lower(), e["dst-port"]
+            self.vecinos.setdefault(a, []).append((pa, b, pb))
+            self.vecinos.setdefault(b, []).append((pb, a, pa))
+        self._hacia = {}        # destino -> {switch: (puerto_salida, siguiente, puerto_entrada)}
+        self._caminos = {}      # (origen, destino) -> (switches, enlaces) o None
+
+    @classmethod
+    def capturar(cls):
+        # Única parte que consulta al controlador
+        dispositivos = controller.get("/wm/device/")
+        enlaces = controller.get("/wm/topology/links/json")
+        if dispositivos is None or enlaces is None or dispositivos.status_code != 200 or enlaces.status_code != 200:
+            return None
+        return cls(dispositivos.json(), enlaces.json())
+
+    def guardar(self, nombre_archivo):
+        with open(nombre_archivo, "w") as f:
+            json.dump({"fecha": time.strftime("%Y-%m-%dT%H:%M:%S"), "dispositivos": self.dispositivos,
+                       "enlaces": self.enlaces}, f)
+
+    @classmethod
+    def cargar(cls, nombre_archivo):
+        with open(nombre_archivo) as f:
+            data = json.load(f)
+        return cls(data.get("dispositivos", []), data.get("enlaces", []))
+
+    def attachment_point(self, mac):
+        aps = self.cache.aps_por_mac.get(mac.lower()) if mac else None
+        return (aps[0][0].lower(), aps[0][1]) if aps else None
+
+    def _arbol_hacia(self, destino):
+        arbol = self._hacia.get(destino)
+        if arbol is None:
+            arbol = {destino: None}
+            frontera = [destino]
+            while frontera:
+                siguiente_frontera = []
+                for actual in frontera:
+                    for puerto, vecino, puerto_vecino in sorted(self.vecinos.get(actual, [])):
+                        if vecino not in arbol:
+                            # desde `vecino` se sale por puerto_vecino hacia `actual`
+                            arbol[vecino] = (puerto_vecino, actual, puerto)
+                            siguiente_frontera.append(vecino)
+                frontera = siguiente_frontera
+            self._hacia[destino] = arbol
+        return arbol
+
+    def camino(self, origen, destino):
+        # (saltos, enlaces normalizados) entre dos switches, o None. Cada
+        # salto es (switch, puerto_entrada, puerto_salida); los puertos de los
+        # hosts (entrada del primero, salida del último) quedan en None.
+        clave = (origen, destino)
+        if clave not in self._caminos:
+            arbol = self._arbol_hacia(destino)
+            if origen not in arbol:
+                self._caminos[clave] = None
+            else:
+                saltos, enlaces = [], []
+                actual, entrada = origen, None
+                while arbol[actual] is not None:
+                    puerto_salida, siguiente, puerto_entrada = arbol[actual]
+                    saltos.append((actual, entrada, puerto_salida))
+                    enlaces.append(enlace_normalizado(actual, puerto_salida, siguiente, puerto_entrada))
+                    actual, entrada = siguiente, puerto_entrada
+                saltos.append((actual, entrada, None))
+                self._caminos[clave] = (tuple(saltos), tuple(enlaces))
+        return self._caminos[clave]
+
+
+def planificar(red, capacidad=FLOW_TABLE_CAPACITY, workers=BULK_WORKERS, top=10, verbose=True, agregada=None):
+    # Simula la provisión de todas las conexiones autorizadas sobre la red
+    # del snapshot, sin llamar al controlador: flows por switch (propios y
+    # compartidos), carga de enlaces y llamadas REST / tiempo proyectados.
+    # agregada=None usa AGREGAR_FLOWS.
+    if agregada is None:
+        agregada = AGREGAR_FLOWS
+    inicio = time.perf_counter()
+    flows_por_switch = {}
+    arp = set()
+    agregados = {}          # nombre -> acciones de las idas compartidas
+    carga_enlaces = {}
+
+    # Lo que ya está instalado
+    for conexion in base_datos.conexiones.values():
+        for _, switch in conexion.flows:
+            flows_por_switch[switch.lower()] = flows_por_switch.get(switch.lower(), 0) + 1
+        for flow in conexion.compartidos:
+            if flow["name"].startswith("agg_"):
+                agregados[flow["name"]] = flow["actions"]
+                flows_por_switch[flow["switch"].lower()] = flows_por_switch.get(flow["switch"].lower(), 0) + 1
+            else:
+                arp.add(flow["switch"].lower())
+        for enlace in conexion.enlaces():
+            carga_enlaces[enlace] = carga_enlaces.get(enlace, 0) + 1
+
+    nuevas = existentes = sin_ap = sin_ruta = 0
+    pushes = arp_nuevos = agregados_nuevos = 0
+    pares_ruta = set()
+    for handler, (cod, nombre_servidor, nombre_servicio) in conexiones_autorizadas().items():
+        if base_datos.conexion(handler):
+            existentes += 1
+            continue
+        alumno = base_datos.alumno(cod)
+        servidor = base_datos.servidor(nombre_servidor)
+        ap1 = red.attachment_point(alumno.mac) if alumno else None
+        ap2 = red.attachment_point(red.cache.mac_por_ip.get(servidor.ip)) if servidor else None
+        if ap1 is None or ap2 is None:
+            sin_ap += 1
+            continue
+        camino = red.camino(ap1[0], ap2[0])
+        if camino is None:
+            sin_ruta += 1
+            continue
+        saltos, enlaces = camino
+        nuevas += 1
+        pares_ruta.add((ap1[0], ap2[0]))
+        for i, (switch, entrada, salida) in enumerate(saltos):
+            if switch not in arp:
+                arp.add(switch)
+                arp_nuevos += 1
+            propios = 2                 # _fwd_ y _rev_
+            if agregada and i > 0:
+                # Mismo nombre y acción que flow_agregado_de_hop
+                servicio = next((svc for svc in servidor.servicios if svc.nombre.lower() == nombre_servicio), None)
+                nombre = (f"agg_{switch.replace(':', '')}_{entrada}_"
+                          f"{nombre_servidor}_{servicio.nombre if servicio else nombre_servicio}_fwd")
+                acciones = f"output={ap2[1] if salida is None else salida}"
+                if nombre not in agregados:
+                    agregados[nombre] = acciones
+                    agregados_nuevos += 1
+                    flows_por_switch[switch] = flows_por_switch.get(switch, 0) + 1
+                if agregados[nombre] == acciones:
+                    propios = 1         # solo el retorno por alumno
+            flows_por_switch[switch] = flows_por_switch.get(switch, 0) + propios
+            pushes += propios
+        for enlace in enlaces:
+            carga_enlaces[enlace] = carga_enlaces.get(enlace, 0) + 1
+    for switch in arp:
+        flows_por_switch[switch] = flows_por_switch.get(switch, 0) + 1
+
+    rutas_rest = len(pares_ruta - set(route_cache.rutas))
+    latencia_push = metricas.latencia_promedio("POST", "/wm/staticflowpusher/json") or PLAN_LATENCIA
+    latencia_ruta = metricas.latencia_promedio("GET", "/wm/topology/route") or PLAN_LATENCIA
+    segundos = ((pushes + arp_nuevos + agregados_nuevos) * latencia_push
+                + rutas_rest * latencia_ruta) / max(workers, 1)
+
+    switches = sorted(flows_por_switch.items(), key=lambda x: -x[1])
+    plan = {
+        "conexiones_nuevas": nuevas,
+        "conexiones_existentes": existentes,
+        "sin_attachment_point": sin_ap,
+        "sin_ruta": sin_ruta,
+        "flows_totales": sum(flows_por_switch.values()),
+        "capacidad_por_switch": capacidad,
+        "switches_excedidos": [(s, n) for s, n in switches if n > capacidad],
+        "switches_mas_cargados": switches[:top],
+        "enlaces_mas_cargados": sorted(carga_enlaces.items(), key=lambda x: -x[1])[:top],
+        "modo_agregado": agregada,
+        "llamadas_rest": {"push_flows": pushes, "push_arp": arp_nuevos, "push_agregados": agregados_nuevos,
+                          "rutas": rutas_rest, "dispositivos": 1},
+        "latencias_s": {"push": latencia_push, "ruta": latencia_ruta},
+        "segundos_proyectados": segundos,
+        "segundos_planificacion": time.perf_counter() - inicio,
+    }
+    if verbose:
+        imprimir_plan(plan, workers)
+    return plan
+
+
+def imprimir_plan(plan, workers):
+    print(f"Conexiones: {plan['conexiones_nuevas']} nuevas, {plan['conexiones_existentes']} ya instaladas, "
+          f"{plan['sin_attachment_point']} sin attachment point, {plan['sin_ruta']} sin ruta.")
+    capacidad = plan["capacidad_por_switch"]
+    print(f"Flows proyectados: {plan['flows_totales']}{' en modo agregado' if plan['modo_agregado'] else ''} "
+          f"(capacidad asumida {capacidad} por switch).")
+    print("Switches más cargados:")
+    for switch, n in plan["switches_mas_cargados"]:
+        print(f"  {switch}  {n:7d} flows  {n / capacidad:6.1%}{'  ⚠️ excede la capacidad' if n > capacidad else ''}")
+    if plan["switches_excedidos"]:
+        print(f"⚠️ {len(plan['switches_excedidos'])} switches exceden la capacidad.")
+    print("Enlaces más cargados (conexiones):")
+    for ((a, pa), (b, pb)), n in plan["enlaces_mas_cargados"]:
+        print(f"  {a}:{pa} <-> {b}:{pb}  {n}")
+    llamadas = plan["llamadas_rest"]
+    total = sum(llamadas.values())
+    print(f"Llamadas REST proyectadas: {total} ({llamadas['push_flows']} flows por alumno, "
+          f"{llamadas['push_agregados']} agregados, {llamadas['push_arp']} ARP, {llamadas['rutas']} rutas, "
+          f"{llamadas['dispositivos']} dispositivos).")
+    print(f"Tiempo proyectado con {workers} hilos: {plan['segundos_proyectados']:.1f} s "
+          f"(push {plan['latencias_s']['push'] * 1000:.1f} ms, ruta {plan['latencias_s']['ruta'] * 1000:.1f} ms "
+          f"por llamada).")
+    print(f"Planificación calculada en {plan['segundos_planificacion']:.2f} s.")
 
 
 def menuConexiones():
@@ -180,7 +2267,14 @@ def menuConexiones():
         print("1) Crear conexión")
         print("2) Listar conexiones")
         print("3) Borrar conexión")
-        print("4) Volver al menú principal")
+        print("4) Provisión masiva por curso")
+        print("5) Borrar conexiones de un alumno, curso o servidor")
+        print("6) Reconciliar flows con el controlador")
+        print("7) Iniciar/detener vigilante de rutas")
+        print("8) Refrescar dispositivos y topología")
+        print("9) Ver métricas del controlador")
+        print("10) Planificar capacidad de tablas de flows (sin tocar el controlador)")
+        print("11) Volver al menú principal")
 
         opcion = input(">>> ").strip()
 
@@ -188,152 +2282,518 @@ def menuConexiones():
             cod_alumno = input("Código del alumno: ").strip()
             nombre_servidor = input("Nombre del servidor: ").strip()
             nombre_servicio = input("Servicio a usar (ej. ssh): ").lower().strip()
-            
-            alumno = next((a for a in base_datos["alumnos"] if str(a.codigo) == cod_alumno), None)
-            servidor = next((s for s in base_datos["servidores"] if s.nombre == nombre_servidor), None)
-
-            if not alumno or not servidor:
-                print("❌ Alumno o servidor no encontrado.")
-                continue
-
-            autorizado = False
-            for curso in base_datos["cursos"]:
-                if curso.estado == "DICTANDO" and int(cod_alumno) in curso.alumnos:
-                    for srv in curso.servidores:
-                        if srv["nombre"] == nombre_servidor and nombre_servicio in srv["servicios_permitidos"]:
-                            autorizado = True
-                            break
-            if not autorizado:
-                print("Alumno NO autorizado.")
-                continue
-
-            servicio = next((s for s in servidor.servicios if s.nombre.lower() == nombre_servicio), None)
-            if not servicio:
-                print("Servicio no encontrado.")
-                continue
 
-            ap1 = get_attachment_points(alumno.mac)
-            ap2 = get_attachment_points(get_mac_from_ip(servidor.ip))
-            if not ap1 or not ap2:
-                print("No se pudieron obtener puntos de conexión.")
+            with metricas.fase("menu.crear_conexion"):
+                conexion, error = conectar(cod_alumno, nombre_servidor, nombre_servicio)
+            if conexion is None:
+                print(error)
                 continue
-
-            ruta = get_route(ap1[0], ap1[1], ap2[0], ap2[1])
-            
-            if not ruta:
-                print("Ruta no encontrada.")
-            else:
-                print(f"Ruta: {ruta}")
-                
-
-            handler = f"{alumno.codigo}_{servidor.nombre}_{servicio.nombre}"
-            build_route(ruta, alumno, servidor, servicio, handler)
-            """
-            dpid_origen, _ = ruta[0]
-            arp_flow = {
-                "switch": dpid_origen,
-                "name": f"{handler}_arp_flood",
-                "priority": "32768",
-                "eth_type": "0x0806",
-                "active": "true",
-                "actions": "FLOOD"
-            }
-            requests.post(f"{BASE_URL}/wm/staticflowpusher/json", json=arp_flow)
-            """
-
-            
-
-            base_datos["conexiones"].append(Conexion(handler, alumno, servidor, servicio))
-            print(f"Conexión creada con handler: {handler}")
+            print(f"Conexión creada con handler: {conexion.handler}")
 
         elif opcion == "2":
-            if not base_datos["conexiones"]:
+            if not base_datos.conexiones:
                 print("📭 No hay conexiones registradas.")
             else:
-                for c in base_datos["conexiones"]:
+                for c in base_datos.conexiones.values():
                     print(f"- Handler: {c.handler} | Alumno: {c.alumno.nombre} | Servidor: {c.servidor.nombre} | Servicio: {c.servicio.nombre}")
 
         elif opcion == "3":
             handler = input("Ingrese handler a eliminar: ")
-            conexion = next((c for c in base_datos["conexiones"] if c.handler == handler), None)
+            conexion = base_datos.conexion(handler)
             if not conexion:
                 print("Conexión no encontrada.")
                 continue
 
-            for i in range(0, 10):
-                for suf in ["_fwd_", "_rev_"]:
-                    nombre_flow = f"{handler}{suf}{i}"
-                    requests.delete(f"{BASE_URL}/wm/staticflowpusher/json", json={"name": nombre_flow})
-
-            base_datos["conexiones"].remove(conexion)
+            with metricas.fase("menu.borrar_conexion"):
+                fallos = eliminar_conexiones([conexion])
+            if fallos[handler]:
+                print(f"⚠️ La conexión se conserva con {len(fallos[handler])} flows pendientes de borrar.")
+                continue
             print("Conexión eliminada correctamente.")
 
         elif opcion == "4":
+            cod = input("Código del curso (vacío = todos los cursos DICTANDO): ").strip().upper()
+            por_defecto = "S/n" if AGREGAR_FLOWS else "s/N"
+            respuesta = input(f"¿Flows agregados fuera del switch de cada alumno? ({por_defecto}): ").strip().lower()
+            agregada = AGREGAR_FLOWS if not respuesta else respuesta == "s"
+            with metricas.fase("menu.provision_masiva"):
+                provisionar_curso(cod or None, agregada=agregada)
+
+        elif opcion == "5":
+            tipo = input("Borrar por alumno (a), curso (c) o servidor (s): ").strip().lower()
+            clave = input("Código o nombre: ").strip()
+            if tipo == "a" and clave.isdigit():
+                conexiones = base_datos.conexiones_de_alumno(int(clave))
+            elif tipo == "c" and base_datos.curso(clave.upper()):
+                conexiones = base_datos.conexiones_de_curso(base_datos.curso(clave.upper()))
+            elif tipo == "s":
+                conexiones = base_datos.conexiones_de_servidor(clave)
+            else:
+                print("Opción o clave inválida.")
+                continue
+            if not conexiones:
+                print("📭 No hay conexiones que borrar.")
+                continue
+            inicio = time.perf_counter()
+            with metricas.fase("menu.borrar_masivo"):
+                fallos = eliminar_conexiones(conexiones)
+            con_fallos = sum(1 for pendientes in fallos.values() if pendientes)
+            print(f"{len(conexiones) - con_fallos} conexiones eliminadas, {con_fallos} con errores "
+                  f"en {time.perf_counter() - inicio:.2f} s.")
+
+        elif opcion == "6":
+            with metricas.fase("menu.reconciliar"):
+                reconciliar()
+
+        elif opcion == "7":
+            if vigilante.activo():
+                vigilante.detener()
+                print("Vigilante de rutas detenido.")
+            else:
+                vigilante.iniciar()
+                print(f"Vigilante de rutas iniciado (cada {vigilante.intervalo} s).")
+
+        elif opcion == "8":
+            device_cache.invalidar()
+            if device_cache.refrescar():
+                print(f"Tabla de dispositivos actualizada ({len(device_cache.aps_por_mac)} MACs).")
+            route_cache.revisar_topologia(forzar=True)
+            print(route_cache.resumen())
+
+        elif opcion == "9":
+            print(metricas.resumen())
+            archivo = input("Archivo para exportar en formato Prometheus (vacío = no exportar): ").strip()
+            if archivo:
+                metricas.exportar_prometheus(archivo)
+                print(f"Métricas exportadas a {archivo}")
+            if input("¿Reiniciar métricas? (s/n): ").strip().lower() == "s":
+                metricas.reiniciar()
+
+        elif opcion == "10":
+            archivo = input("Snapshot de red (JSON; vacío = capturarlo ahora del controlador): ").strip()
+            if archivo:
+                try:
+                    red = SnapshotRed.cargar(archivo)
+                except (OSError, ValueError) as e:
+                    print(f"No se pudo leer el snapshot: {e}")
+                    continue
+            else:
+                red = SnapshotRed.capturar()
+                if red is None:
+                    print("No se pudo obtener dispositivos y enlaces del controlador.")
+                    continue
+                destino = input("Guardar el snapshot en (vacío = no guardar): ").strip()
+                if destino:
+                    red.guardar(destino)
+            capacidad = input(f"Capacidad por switch [{FLOW_TABLE_CAPACITY}]: ").strip()
+            planificar(red, int(capacidad) if capacidad.isdigit() else FLOW_TABLE_CAPACITY)
+
+        elif opcion == "11":
             break
         else:
             print("Opción inválida.")
 
 def opcion1():
-    nombre_archivo = input("Ingrese el nombre del archivo YAML (ej. datos.yaml): ").strip()
+    nombre_archivo = input("Ingrese el nombre del archivo (.yaml, .jsonl o .bin; ej. datos.yaml): ").strip()
     importar_archivo(nombre_archivo)
 
-def importar_archivo(nombre_archivo):
+# Cargador y dumper YAML: los de libyaml (C) si PyYAML se compiló con él. Se
+# resuelven en cargador_yaml()/dumper_yaml() la primera vez que se usan.
+YAML_LOADER = None
+YAML_DUMPER = None
+# A partir de este tamaño (bytes) el archivo YAML se importa en streaming
+STREAM_IMPORT_THRESHOLD = 8 * 1024 * 1024
+
+# Formato de importación/exportación según la extensión del archivo:
+#   yaml  -> la forma de datos.yaml
+#   jsonl -> una línea JSON [bloque, elemento] por entidad, misma forma que el YAML
+#   bin   -> lotes de tuplas en marshal, cada uno precedido de su largo
+#            (solo para la misma versión de Python)
+FORMATOS = {".yaml": "yaml", ".yml": "yaml", ".jsonl": "jsonl", ".bin": "bin"}
+# Cabecera de los .bin y cantidad de entidades por lote
+SNAPSHOT_MAGIC = b"LAB6SNAP1\n"
+SNAPSHOT_LOTE = 4096
+
+
+def cargador_yaml():
+    global YAML_LOADER
+    if YAML_LOADER is None:
+        import yaml
+        YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    return YAML_LOADER
+
+
+def dumper_yaml():
+    global YAML_DUMPER
+    if YAML_DUMPER is None:
+        import yaml
+        YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+    return YAML_DUMPER
+
+
+def formato_de(nombre_archivo):
+    # Los archivos sin extensión conocida se tratan como YAML
+    return FORMATOS.get(os.path.splitext(nombre_archivo)[1].lower(), "yaml")
+
+
+def alumno_desde_dict(a):
+    return Alumno(a["nombre"], a["codigo"], a["mac"])
+
+
+def curso_desde_dict(c):
+    return Curso(c["codigo"], c["estado"], c["nombre"], c.get("alumnos", []), c.get("servidores", []))
+
+
+def servidor_desde_dict(s):
+    servicios = [Servicio(svc["nombre"], svc["protocolo"], svc["puerto"]) for svc in s["servicios"]]
+    return Servidor(s["nombre"], s["ip"], servicios)
+
+
+def alumno_a_dict(a):
+    return {"nombre": a.nombre, "codigo": a.codigo, "mac": a.mac}
+
+
+def curso_a_dict(c):
+    return {
+        "codigo": c.codigo,
+        "estado": c.estado,
+        "nombre": c.nombre,
+        "alumnos": c.alumnos.tolist(),
+        "servidores": [
+            {"nombre": nombre, "servicios_permitidos": list(servicios)}
+            for nombre, servicios in c.servidores.items()
+        ],
+    }
+
+
+def servidor_a_dict(s):
+    return {
+        "nombre": s.nombre,
+        "ip": s.ip,
+        "servicios": [
+            {
+                "nombre": svc.nombre,
+                "protocolo": svc.protocolo,
+                "puerto": svc.puerto
+            }
+            for svc in s.servicios
+        ]
+    }
+
+
+# ---- formato bin: una tupla por entidad, sin claves ni MAC en texto ----
+def alumno_a_tupla(a):
+    return a.nombre, a.codigo, a.mac_int
+
+
+def alumno_desde_tupla(t):
+    return Alumno.desde_int(*t)
+
+
+def curso_a_tupla(c):
+    return c.codigo, c.estado, c.nombre, c.alumnos.tobytes(), tuple(c.servidores.items())
+
+
+def curso_desde_tupla(t):
+    codigo, estado, nombre, alumnos, servidores = t
+    curso = Curso(codigo, estado, nombre)
+    curso.alumnos.frombytes(alumnos)
+    curso.servidores = {_intern(n): tuple(_intern(svc) for svc in svcs) for n, svcs in servidores}
+    return curso
+
+
+def servidor_a_tupla(s):
+    return s.nombre, s.ip, tuple((svc.nombre, svc.protocolo, svc.puerto) for svc in s.servicios)
+
+
+def servidor_desde_tupla(t):
+    nombre, ip, servicios = t
+    return Servidor(nombre, ip, [Servicio(*svc) for svc in servicios])
+
+
+def leer_registros_jsonl(file):
+    # Entrega (bloque, elemento) línea a línea
+    for linea in file:
+        if linea.strip():
+            bloque, elemento = json.loads(linea)
+            yield bloque, elemento
+
+
+def escribir_lote_bin(file, bloque, tuplas):
+    # Cada lote va precedido de su largo: leerlo con un solo read() y
+    # marshal.loads es mucho más rápido que marshal.load sobre el archivo
+    import marshal
+
+    datos = marshal.dumps((bloque, tuplas))
+    file.write(len(datos).to_bytes(4, "little"))
+    file.write(datos)
+
+
+def leer_lotes_bin(file):
+    # Entrega (bloque, [tuplas]) lote a lote
+    import marshal
+
+    if file.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        raise ValueError("El archivo no es un snapshot .bin de este programa.")
+    while True:
+        largo = file.read(4)
+        if not largo:
+            return
+        datos = file.read(int.from_bytes(largo, "little"))
+        bloque, tuplas = marshal.loads(datos)
+        yield bloque, tuplas
+
+
+def _valor_desde_eventos(loader):
+    # Construye un valor Python a partir de los eventos del parser, sin
+    # armar el árbol de nodos del documento completo.
+    import yaml
+
+    evento = loader.get_event()
+    if isinstance(evento, yaml.ScalarEvent):
+        tag = evento.tag
+        if tag is None or tag == "!":
+            tag = loader.resolve(yaml.ScalarNode, evento.value, evento.implicit)
+        nodo = yaml.ScalarNode(tag, evento.value, style=evento.style)
+        return loader.yaml_constructors[tag](loader, nodo)
+    if isinstance(evento, yaml.SequenceStartEvent):
+        lista = []
+        while not loader.check_event(yaml.SequenceEndEvent):
+            lista.append(_valor_desde_eventos(loader))
+        loader.get_event()
+        return lista
+    if isinstance(evento, yaml.MappingStartEvent):
+        mapa = {}
+        while not loader.check_event(yaml.MappingEndEvent):
+            clave = _valor_desde_eventos(loader)
+            mapa[clave] = _valor_desde_eventos(loader)
+        loader.get_event()
+        return mapa
+    raise yaml.YAMLError(f"Evento no soportado en importación streaming: {evento}")
+
+
+def leer_bloques_yaml(file):
+    # Recorre el documento y entrega (bloque, elemento) para cada elemento de
+    # los bloques de primer nivel, de uno en uno.
+    import yaml
+
+    loader = cargador_yaml()(file)
     try:
-        with open(nombre_archivo, 'r') as file:
-            data = yaml.safe_load(file)
-            base_datos["alumnos"] = [Alumno(a["nombre"], a["codigo"], a["mac"]) for a in data.get("alumnos", [])]
-            base_datos["cursos"] = [Curso(c["codigo"], c["estado"], c["nombre"], c.get("alumnos", []), c.get("servidores", [])) for c in data.get("cursos", [])]
-            base_datos["servidores"] = []
-            for s in data.get("servidores", []):
-                servicios = [Servicio(svc["nombre"], svc["protocolo"], svc["puerto"]) for svc in s["servicios"]]
-                base_datos["servidores"].append(Servidor(s["nombre"], s["ip"], servicios))
-            print(f" Archivo '{nombre_archivo}' importado correctamente.")
+        loader.get_event()                      # StreamStart
+        if loader.check_event(yaml.StreamEndEvent):
+            return
+        loader.get_event()                      # DocumentStart
+        if not loader.check_event(yaml.MappingStartEvent):
+            raise yaml.YAMLError("El documento debe ser un mapeo de bloques.")
+        loader.get_event()
+        while not loader.check_event(yaml.MappingEndEvent):
+            bloque = _valor_desde_eventos(loader)
+            if not loader.check_event(yaml.SequenceStartEvent):
+                _valor_desde_eventos(loader)    # bloque vacío u otro valor
+                continue
+            loader.get_event()
+            while not loader.check_event(yaml.SequenceEndEvent):
+                yield bloque, _valor_desde_eventos(loader)
+            loader.get_event()
+    finally:
+        loader.dispose()
+
+
+def alumnos_repetidos(alumnos):
+    # Alumnos cuyo código o MAC ya apareció antes en la lista
+    codigos, macs, repetidos = set(), set(), []
+    for alumno in alumnos:
+        if alumno.codigo in codigos or alumno.mac_int in macs:
+            repetidos.append(alumno)
+        codigos.add(alumno.codigo)
+        macs.add(alumno.mac_int)
+    return repetidos
+
+
+def importar_archivo(nombre_archivo, streaming=None):
+    constructores = {"alumnos": alumno_desde_dict, "cursos": curso_desde_dict, "servidores": servidor_desde_dict}
+    try:
+        inicio = time.perf_counter()
+        formato = formato_de(nombre_archivo)
+        entidades = {bloque: [] for bloque in constructores}
+        if formato == "bin":
+            desde_tupla = {"alumnos": alumno_desde_tupla, "cursos": curso_desde_tupla,
+                           "servidores": servidor_desde_tupla}
+            with open(nombre_archivo, 'rb') as file:
+                for bloque, tuplas in leer_lotes_bin(file):
+                    if bloque in desde_tupla:
+                        entidades[bloque].extend(map(desde_tupla[bloque], tuplas))
+            detalle = "marshal"
+        elif formato == "jsonl":
+            with open(nombre_archivo, 'r') as file:
+                for bloque, elemento in leer_registros_jsonl(file):
+                    if bloque in constructores:
+                        entidades[bloque].append(constructores[bloque](elemento))
+            detalle = "JSON lines"
+        else:
+            if streaming is None:
+                streaming = os.path.getsize(nombre_archivo) >= STREAM_IMPORT_THRESHOLD
+            with open(nombre_archivo, 'r') as file:
+                if streaming:
+                    for bloque, elemento in leer_bloques_yaml(file):
+                        if bloque in constructores:
+                            entidades[bloque].append(constructores[bloque](elemento))
+                else:
+                    import yaml
+                    data = yaml.load(file, Loader=cargador_yaml()) or {}
+                    for bloque, constructor in constructores.items():
+                        entidades[bloque] = [constructor(e) for e in data.get(bloque) or []]
+            detalle = f"cargador {cargador_yaml().__name__}{', streaming' if streaming else ''}"
+        repetidos = alumnos_repetidos(entidades["alumnos"])
+        if repetidos:
+            for alumno in repetidos[:5]:
+                print(f" Alumno repetido: código {alumno.codigo}, MAC {alumno.mac}")
+            print(f" Importación cancelada: {len(repetidos)} alumnos repiten código o MAC.")
+            return None
+        # Conexiones cuyo alumno, servidor o servicio desaparece o cambia de
+        # MAC, IP o puerto: se borran sus flows antes de reemplazar el roster
+        huerfanas = base_datos.conexiones_huerfanas(entidades["alumnos"], entidades["servidores"])
+        if huerfanas:
+            print(f" {len(huerfanas)} conexiones no corresponden al nuevo roster; borrando sus flows...")
+            fallos = eliminar_conexiones(huerfanas)
+            if any(fallos.values()):
+                print(" Importación cancelada: quedan flows sin borrar de esas conexiones. Reintente.")
+                return None
+        base_datos.cargar(entidades["alumnos"], entidades["cursos"], entidades["servidores"])
+        flows_compartidos.reconstruir(base_datos.listar_conexiones())
+        duracion = time.perf_counter() - inicio
+        print(f" Archivo '{nombre_archivo}' importado correctamente.")
+        print(f" {len(entidades['alumnos'])} alumnos, {len(entidades['cursos'])} cursos, "
+              f"{len(entidades['servidores'])} servidores en {duracion:.2f} s ({detalle}).")
+        # Las conexiones conservadas pueden haber perdido el permiso (curso
+        # inactivo, alumno fuera del curso o servicio no permitido)
+        revocar_no_autorizadas(base_datos.listar_conexiones())
+        return {bloque: len(lista) for bloque, lista in entidades.items()} | {"segundos": duracion}
     except Exception as e:
         print(f" Error al importar archivo: {e}")
+        return None
 
 
 def opcion2():
-    nombre_archivo = input("Ingrese el nombre del archivo YAML a exportar (ej. salida.yaml): ").strip()
-    exportar_archivo(nombre_archivo)    
+    nombre_archivo = input("Ingrese el nombre del archivo a exportar (.yaml, .jsonl o .bin; ej. salida.yaml): ").strip()
+    exportar_archivo(nombre_archivo)
+
+def datos_exportables():
+    # Roster en la misma forma que datos.yaml
+    return {
+        "alumnos": [alumno_a_dict(a) for a in base_datos.alumnos.values()],
+        "cursos": [curso_a_dict(c) for c in base_datos.cursos.values()],
+        "servidores": [servidor_a_dict(s) for s in base_datos.servidores.values()],
+    }
+
+
+def _en_lotes(elementos, tamano=SNAPSHOT_LOTE):
+    lote = []
+    for elemento in elementos:
+        lote.append(elemento)
+        if len(lote) == tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
 
 def exportar_archivo(nombre_archivo):
+    # yaml arma el documento completo; jsonl y bin se escriben entidad por
+    # entidad (o por lotes) sin construir todo en memoria
     try:
-        data = {
-            "alumnos": [
-                {"nombre": a.nombre, "codigo": a.codigo, "mac": a.mac}
-                for a in base_datos["alumnos"]
-            ],
-            "cursos": [
-                {
-                    "codigo": c.codigo,
-                    "estado": c.estado,
-                    "nombre": c.nombre,
-                    "alumnos": c.alumnos,
-                    "servidores": c.servidores,
-                }
-                for c in base_datos["cursos"]
-            ],
-            "servidores": [
-                {
-                    "nombre": s.nombre,
-                    "ip": s.ip,
-                    "servicios": [
-                        {
-                            "nombre": svc.nombre,
-                            "protocolo": svc.protocolo,
-                            "puerto": svc.puerto
-                        }
-                        for svc in s.servicios
-                    ]
-                }
-                for s in base_datos["servidores"]
-            ]
-        }
-        with open(nombre_archivo, 'w') as file:
-            yaml.dump(data, file)
+        formato = formato_de(nombre_archivo)
+        temporal = f"{nombre_archivo}.tmp"
+        bloques = (("alumnos", base_datos.alumnos, alumno_a_dict, alumno_a_tupla),
+                   ("cursos", base_datos.cursos, curso_a_dict, curso_a_tupla),
+                   ("servidores", base_datos.servidores, servidor_a_dict, servidor_a_tupla))
+        if formato == "bin":
+            with open(temporal, 'wb') as file:
+                file.write(SNAPSHOT_MAGIC)
+                for bloque, entidades, _, a_tupla in bloques:
+                    for lote in _en_lotes(map(a_tupla, entidades.values())):
+                        escribir_lote_bin(file, bloque, lote)
+        elif formato == "jsonl":
+            with open(temporal, 'w') as file:
+                for bloque, entidades, a_dict, _ in bloques:
+                    for entidad in entidades.values():
+                        file.write(json.dumps([bloque, a_dict(entidad)], separators=(",", ":")))
+                        file.write("\n")
+        else:
+            import yaml
+            with open(temporal, 'w') as file:
+                yaml.dump(datos_exportables(), file, Dumper=dumper_yaml())
+        os.replace(temporal, nombre_archivo)
         print(f"Archivo '{nombre_archivo}' exportado correctamente.")
+        return True
     except Exception as e:
         print(f"Error al exportar archivo: {e}")
+        return False
+
+
+# ==================== ESTADO =====================
+
+# Instantánea JSON del roster y de las conexiones registradas (con sus flows),
+# para que el CLI continúe entre ejecuciones sin volver a leer el YAML.
+
+def conexion_a_dict(conexion):
+    return {
+        "handler": conexion.handler,
+        "alumno": conexion.alumno.codigo,
+        "servidor": conexion.servidor.nombre,
+        "servicio": conexion.servicio.nombre,
+        "generacion": conexion.generacion,
+        "hops": [list(hop) for hop in conexion.hops],
+        "flows": [list(flow) for flow in conexion.flows],
+        "compartidos": conexion.compartidos,
+        "agregada": conexion.agregada,
+    }
+
+
+def conexion_desde_dict(c):
+    # None si el alumno, servidor o servicio ya no existen en el roster
+    alumno = base_datos.alumno(c["alumno"])
+    servidor = base_datos.servidor(c["servidor"])
+    if alumno is None or servidor is None:
+        return None
+    servicio = next((s for s in servidor.servicios if s.nombre == c["servicio"]), None)
+    if servicio is None:
+        return None
+    conexion = Conexion(c["handler"], alumno, servidor, servicio, c.get("compartidos"),
+                        [tuple(f) for f in c.get("flows", [])], [tuple(h) for h in c.get("hops", [])],
+                        c.get("agregada", False))
+    conexion.generacion = c.get("generacion", 0)
+    return conexion
+
+
+def guardar_estado(nombre_archivo):
+    data = datos_exportables()
+    data["conexiones"] = [conexion_a_dict(c) for c in base_datos.conexiones.values()]
+    # Se escribe a un temporal y se renombra para no dejar el estado a medias
+    temporal = f"{nombre_archivo}.tmp"
+    with open(temporal, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(temporal, nombre_archivo)
+
+
+def cargar_estado(nombre_archivo):
+    with open(nombre_archivo) as f:
+        data = json.load(f)
+    base_datos.cargar(
+        [alumno_desde_dict(a) for a in data.get("alumnos", [])],
+        [curso_desde_dict(c) for c in data.get("cursos", [])],
+        [servidor_desde_dict(s) for s in data.get("servidores", [])],
+    )
+    descartadas = 0
+    for c in data.get("conexiones", []):
+        conexion = conexion_desde_dict(c)
+        if conexion is None:
+            descartadas += 1
+            continue
+        base_datos.agregar_conexion(conexion)
+    flows_compartidos.reconstruir(base_datos.conexiones.values())
+    if descartadas:
+        print(f"⚠️ {descartadas} conexiones del estado no corresponden al roster y se descartaron.")
 
 
 # ==================== MENÚ PRINCIPAL =====================
@@ -368,26 +2828,25 @@ def menu():
                 print("3) Crear nuevo curso")
                 print("4) Actualizar curso (agregar/eliminar alumno)")
                 print("5) Borrar curso")
-                print("6) Volver al menú principal")
+                print("6) Cambiar estado (DICTANDO/INACTIVO)")
+                print("7) Volver al menú principal")
                 subop = input(">>> ").strip()
 
                 if subop == "1":
-                    if not base_datos["cursos"]:
+                    if not base_datos.cursos:
                         print("No hay cursos registrados.")
                     else:
-                        for c in base_datos["cursos"]:
+                        for c in base_datos.cursos.values():
                             print(f"- {c.codigo} | {c.nombre} | Estado: {c.estado}")
 
                 elif subop == "2":
                     cod = input("Ingrese el código del curso: ").upper()
-                    curso = next((c for c in base_datos["cursos"] if c.codigo == cod), None)
+                    curso = base_datos.curso(cod)
                     if curso:
                         print(f"\n{curso.codigo} - {curso.nombre} [{curso.estado}]")
                         print("Alumnos:")
-                        for cod in curso.alumnos:
-                            alumno = next((a for a in base_datos["alumnos"] if a.codigo == cod), None)
-                            if alumno:
-                                print(f"  - {alumno.codigo} | {alumno.nombre}")
+                        for alumno in base_datos.alumnos_de_curso(curso):
+                            print(f"  - {alumno.codigo} | {alumno.nombre}")
                     else:
                         print("Curso no encontrado.")
 
@@ -396,33 +2855,33 @@ def menu():
                     nombre = input("Nombre: ")
                     estado = input("Estado (ejemplo: DICTANDO o INACTIVO): ")
                     nuevo = Curso(codigo, estado, nombre)
-                    base_datos["cursos"].append(nuevo)
-                    print("Curso creado.")
+                    if base_datos.agregar_curso(nuevo):
+                        print("Curso creado.")
+                    else:
+                        print("Ya existe un curso con ese código.")
 
                 elif subop == "4":
                     cod = input("Código del curso a actualizar: ").upper()
-                    curso = next((c for c in base_datos["cursos"] if c.codigo == cod), None)
+                    curso = base_datos.curso(cod)
                     if curso:
                         acc = input("¿Desea agregar (a) o eliminar (e) un alumno?: ").strip().lower()
                         cod_al = input("Código del alumno: ").strip()
 
                         # Validar que el alumno exista
-                        alumno_existe = any(a.codigo == int(cod_al) for a in base_datos["alumnos"])
+                        alumno_existe = base_datos.alumno(int(cod_al)) is not None
 
                         if not alumno_existe:
                             print("Alumno no encontrado.")
                         else:
                             if acc == "a":
-                                if int(cod_al) not in curso.alumnos:
-                                    curso.alumnos.append(int(cod_al))
+                                if base_datos.inscribir(curso, int(cod_al)):
                                     #print(type(curso.alumnos), curso.alumnos)
                                     print("Alumno agregado.")
                                 else:
                                     print("Ya estaba registrado.")
                             elif acc == "e":
                                 #print(curso.alumnos)
-                                if int(cod_al) in curso.alumnos:
-                                    curso.alumnos.remove(int(cod_al))
+                                if desinscribir_alumno(curso, int(cod_al)):
                                     print("Alumno eliminado.")
                                 else:
                                     print("Alumno no estaba registrado.")
@@ -435,14 +2894,23 @@ def menu():
                     #print(cod)
                     #print(base_datos["cursos"])
 
-                    if not any(c.codigo == cod for c in base_datos["cursos"]):
+                    if eliminar_curso(cod) is None:
                         print("Curso no encontrado.")
-                    else:   
-                        base_datos["cursos"] = [c for c in base_datos["cursos"] if c.codigo != cod]
+                    else:
                         print("Curso eliminado ")
                     
 
                 elif subop == "6":
+                    cod = input("Código del curso: ").upper()
+                    estado = input("Nuevo estado (DICTANDO o INACTIVO): ").strip().upper()
+                    if base_datos.curso(cod) is None:
+                        print("Curso no encontrado.")
+                    elif not cambiar_estado_curso(cod, estado):
+                        print("Estado inválido.")
+                    else:
+                        print(f"Curso {cod} en estado {estado}.")
+
+                elif subop == "7":
                     break
 
                 else:
@@ -459,15 +2927,15 @@ def menu():
                 subop = input(">>> ").strip()
 
                 if subop == "1":
-                    if not base_datos["alumnos"]:
+                    if not base_datos.alumnos:
                         print("No hay alumnos registrados.")
                     else:
-                        for a in base_datos["alumnos"]:
+                        for a in base_datos.alumnos.values():
                             print(f"- {a.codigo} | {a.nombre} | MAC: {a.mac}")
 
                 elif subop == "2":
                     cod = input("Ingrese el código del alumno: ").strip()
-                    alumno = next((a for a in base_datos["alumnos"] if a.codigo == int(cod)), None)
+                    alumno = base_datos.alumno(int(cod))
                     if alumno:
                         print(f"Código: {alumno.codigo}")
                         print(f"Nombre: {alumno.nombre}")
@@ -481,11 +2949,9 @@ def menu():
                         codigo = int(input("Código del alumno: ").strip())
                         mac = input("MAC del alumno (formato XX:XX:XX:XX:XX:XX): ").strip()
 
-                        if any(a.codigo == codigo for a in base_datos["alumnos"]):
-                            print("Ya existe un alumno con ese código.")
+                        if not base_datos.agregar_alumno(Alumno(nombre, codigo, mac)):
+                            print("Ya existe un alumno con ese código o esa MAC.")
                         else:
-                            nuevo = Alumno(nombre, codigo, mac)
-                            base_datos["alumnos"].append(nuevo)
                             print(f"Alumno '{nombre}' registrado correctamente.")
                     except Exception as e:
                         print(f"Error al registrar alumno: {e}")
@@ -504,18 +2970,18 @@ def menu():
                 subop = input(">>> ").strip()
 
                 if subop == "1":
-                    if not base_datos["servidores"]:
+                    if not base_datos.servidores:
                         print("No hay servidores registrados.")
                     else:
-                        for s in base_datos["servidores"]:
+                        for s in base_datos.servidores.values():
                             print(f"- {s.nombre} | IP: {s.ip}")
                             
 
                 elif subop == "2":
                     ipServidor = input("Ingrese la IP del servidor: ").strip()
-                    server = next((a for a in base_datos["servidores"] if a.ip == ipServidor), None)
+                    server = base_datos.servidor_de_ip(ipServidor)
                     if server:
-                        for servicio in s.servicios:
+                        for servicio in server.servicios:
                                 print(f"   > Servicio: {servicio.nombre} - {servicio.protocolo}/{servicio.puerto}")
                     else:
                         print("Servidor no encontrado.")
@@ -527,21 +2993,509 @@ def menu():
                     print("Opción inválida.")            
             
 
+        elif opcion == "6":
+            cod = input("Ingrese el código del alumno: ").strip()
+            try:
+                permitidos = base_datos.autorizacion.servicios_de(int(cod))
+            except ValueError:
+                print("Código inválido.")
+                continue
+            if not permitidos:
+                print("El alumno no tiene servicios autorizados.")
+            else:
+                print(f"Servicios autorizados para {cod}:")
+                for nombre_servidor, nombre_servicio in permitidos:
+                    print(f"  - {nombre_servidor} / {nombre_servicio}")
+
         elif opcion == "7":
             menuConexiones()
 
         
         elif opcion == "8":
+            if METRICAS_ARCHIVO:
+                metricas.exportar_prometheus(METRICAS_ARCHIVO)
             print("Saliendo del programa.")
             break
 
         else:
             print("Opción inválida.")
 
+# ==================== API HTTP =====================
+
+# Conexiones y consultas de alumnos y cursos por HTTP/JSON (subcomando
+# `serve`), para que el portal pida accesos sin pasar por el menú. Cada
+# petición se atiende en su propio hilo. Las creaciones y borrados de un
+# mismo handler se agrupan con llamadas_agrupadas, y como mucho
+# API_MAX_CONCURRENTES de ellos llaman al controlador a la vez.
+API_HOST = "127.0.0.1"
+API_PUERTO = 8000
+API_MAX_CONCURRENTES = BULK_WORKERS
+
+cupos_api = threading.BoundedSemaphore(API_MAX_CONCURRENTES)
+
+
+class ErrorAPI(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def _con_cupo(funcion, *args, **kwargs):
+    with cupos_api:
+        return funcion(*args, **kwargs)
+
+
+def conexion_resumen(conexion):
+    return {
+        "handler": conexion.handler,
+        "alumno": conexion.alumno.codigo,
+        "servidor": conexion.servidor.nombre,
+        "servicio": conexion.servicio.nombre,
+        "agregada": conexion.agregada,
+        "hops": [list(hop) for hop in conexion.hops],
+        "flows": len(conexion.flows),
+        "compartidos": len(conexion.compartidos),
+    }
+
+
+def api_salud(consulta, cuerpo):
+    return 200, {
+        "estado": "ok",
+        "alumnos": len(base_datos.alumnos),
+        "cursos": len(base_datos.cursos),
+        "conexiones": len(base_datos.conexiones),
+    }
+
+
+def api_metricas(consulta, cuerpo):
+    return 200, metricas.prometheus()
+
+
+def api_listar_conexiones(consulta, cuerpo):
+    if "alumno" in consulta:
+        if not consulta["alumno"].isdigit():
+            raise ErrorAPI(400, "El código de alumno debe ser numérico.")
+        conexiones = base_datos.conexiones_de_alumno(int(consulta["alumno"]))
+    elif "servidor" in consulta:
+        conexiones = base_datos.conexiones_de_servidor(consulta["servidor"])
+    else:
+        conexiones = base_datos.listar_conexiones()
+    return 200, [conexion_resumen(c) for c in conexiones]
+
+
+def api_crear_conexion(consulta, cuerpo):
+    # Cuerpo: {"alumno": código, "servidor": nombre, "servicio": nombre,
+    # "agregada": opcional}. Si la conexión ya existe se devuelve con 200.
+    if not isinstance(cuerpo, dict) or any(cuerpo.get(campo) in (None, "")
+                                           for campo in ("alumno", "servidor", "servicio")):
+        raise ErrorAPI(400, "Se requieren alumno, servidor y servicio.")
+    cod_alumno = str(cuerpo["alumno"])
+    alumno = base_datos.alumno(int(cod_alumno)) if cod_alumno.isdigit() else None
+    if alumno is None:
+        raise ErrorAPI(404, "Alumno no encontrado.")
+    servidor = base_datos.servidor(str(cuerpo["servidor"]))
+    if servidor is None:
+        raise ErrorAPI(404, "Servidor no encontrado.")
+    nombre_servicio = str(cuerpo["servicio"]).lower()
+    servicio = next((s for s in servidor.servicios if s.nombre.lower() == nombre_servicio), None)
+    if servicio is None:
+        raise ErrorAPI(404, "Servicio no encontrado.")
+    if not base_datos.autorizacion.autorizado(alumno.codigo, servidor.nombre, nombre_servicio):
+        raise ErrorAPI(403, "Alumno NO autorizado.")
+
+    handler = f"{alumno.codigo}_{servidor.nombre}_{servicio.nombre}"
+    existente = base_datos.conexion(handler)
+    if existente is not None:
+        return 200, conexion_resumen(existente)
+    agregada = cuerpo.get("agregada")
+    agregada = AGREGAR_FLOWS if agregada is None else bool(agregada)
+    # Misma clave que crear_conexion: se agrupa también con el menú o el CLI
+    conexion, error = llamadas_agrupadas.ejecutar(("conexion", handler), _con_cupo, _crear_conexion,
+                                                  handler, alumno, servidor, servicio, False, agregada)
+    if conexion is None:
+        # Otra creación del mismo handler pudo terminar entre la comprobación
+        # de arriba y el vuelo; entonces _crear_conexion responde "Ya existe"
+        existente = base_datos.conexion(handler)
+        if existente is not None:
+            return 200, conexion_resumen(existente)
+        raise ErrorAPI(502, error)
+    return 201, conexion_resumen(conexion)
+
+
+def api_obtener_conexion(consulta, cuerpo, handler):
+    conexion = base_datos.conexion(handler)
+    if conexion is None:
+        raise ErrorAPI(404, f"Conexión {handler} no encontrada.")
+    return 200, conexion_resumen(conexion)
+
+
+def api_borrar_conexion(consulta, cuerpo, handler):
+    conexion = base_datos.conexion(handler)
+    if conexion is None:
+        raise ErrorAPI(404, f"Conexión {handler} no encontrada.")
+    # Un hilo por petición: los flows de cada conexión se borran en serie
+    fallos = llamadas_agrupadas.ejecutar(("borrar", handler), _con_cupo, eliminar_conexiones, [conexion], 1)
+    pendientes = fallos.get(handler)
+    if pendientes:
+        return 502, {
+            "error": f"No se pudieron borrar {len(pendientes)} flows; la conexión se conserva con ellos.",
+            "pendientes": [{"nombre": n, "switch": s, "detalle": d} for n, s, d in pendientes],
+        }
+    return 200, {"handler": handler, "borrada": True}
+
+
+def api_alumno(consulta, cuerpo, codigo):
+    alumno = base_datos.alumno(int(codigo))
+    if alumno is None:
+        raise ErrorAPI(404, "Alumno no encontrado.")
+    datos = alumno_a_dict(alumno)
+    datos["cursos"] = [c.codigo for c in list(base_datos.cursos.values()) if c.tiene_alumno(alumno.codigo)]
+    datos["conexiones"] = [conexion_resumen(c) for c in base_datos.conexiones_de_alumno(alumno.codigo)]
+    return 200, datos
+
+
+def api_listar_cursos(consulta, cuerpo):
+    estado = consulta.get("estado", "").upper()
+    return 200, [
+        {"codigo": c.codigo, "estado": c.estado, "nombre": c.nombre, "alumnos": len(c.alumnos)}
+        for c in list(base_datos.cursos.values()) if not estado or c.estado == estado
+    ]
+
+
+def api_curso(consulta, cuerpo, codigo):
+    curso = base_datos.curso(codigo.upper())
+    if curso is None:
+        raise ErrorAPI(404, "Curso no encontrado.")
+    return 200, curso_a_dict(curso)
+
+
+# (método, patrón, etiqueta en las métricas, función)
+RUTAS_API = [
+    ("GET", re.compile(r"^/salud$"), "/salud", api_salud),
+    ("GET", re.compile(r"^/metricas$"), "/metricas", api_metricas),
+    ("GET", re.compile(r"^/conexiones$"), "/conexiones", api_listar_conexiones),
+    ("POST", re.compile(r"^/conexiones$"), "/conexiones", api_crear_conexion),
+    ("GET", re.compile(r"^/conexiones/([^/]+)$"), "/conexiones/{handler}", api_obtener_conexion),
+    ("DELETE", re.compile(r"^/conexiones/([^/]+)$"), "/conexiones/{handler}", api_borrar_conexion),
+    ("GET", re.compile(r"^/alumnos/(\d+)$"), "/alumnos/{codigo}", api_alumno),
+    ("GET", re.compile(r"^/cursos$"), "/cursos", api_listar_cursos),
+    ("GET", re.compile(r"^/cursos/([^/]+)$"), "/cursos/{codigo}", api_curso),
+]
+
+
+def crear_servidor_api(host=API_HOST, puerto=API_PUERTO):
+    # Se importa aquí para que el resto del CLI no cargue http.server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, unquote, urlsplit
+
+    class ManejadorAPI(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Cabeceras y cuerpo en un solo segmento (sin esperar el ACK retardado)
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _responder(self, estado, cuerpo):
+            if isinstance(cuerpo, str):
+                datos, tipo = cuerpo.encode(), "text/plain; version=0.0.4"
+            else:
+                datos, tipo = json.dumps(cuerpo).encode(), "application/json"
+            self.send_response(estado)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def _atender(self, metodo):
+            largo = int(self.headers.get("Content-Length", 0))
+            crudo = self.rfile.read(largo) if largo else b""
+            partes = urlsplit(self.path)
+            consulta = {clave: valores[-1] for clave, valores in parse_qs(partes.query).items()}
+
+            encontrada = None
+            permitidos = []
+            for metodo_ruta, patron, etiqueta, funcion in RUTAS_API:
+                m = patron.match(partes.path)
+                if m:
+                    permitidos.append(metodo_ruta)
+                    if metodo_ruta == metodo:
+                        encontrada = (m, etiqueta, funcion)
+            if encontrada is None:
+                if permitidos:
+                    return self._responder(405, {"error": f"Métodos permitidos: {', '.join(permitidos)}"})
+                return self._responder(404, {"error": f"Ruta no encontrada: {partes.path}"})
+            try:
+                cuerpo = json.loads(crudo) if crudo else None
+            except ValueError:
+                return self._responder(400, {"error": "El cuerpo no es JSON válido."})
+
+            m, etiqueta, funcion = encontrada
+            with metricas.fase(f"api.{metodo} {etiqueta}"):
+                try:
+                    estado, respuesta = funcion(consulta, cuerpo, *map(unquote, m.groups()))
+                except ErrorAPI as e:
+                    estado, respuesta = e.estado, {"error": str(e)}
+                except Exception as e:
+                    estado, respuesta = 500, {"error": f"{type(e).__name__}: {e}"}
+            self._responder(estado, respuesta)
+
+        def do_GET(self):
+            self._atender("GET")
+
+        def do_POST(self):
+            self._atender("POST")
+
+        def do_DELETE(self):
+            self._atender("DELETE")
+
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorAPI)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def servir_api(host=API_HOST, puerto=API_PUERTO, concurrentes=API_MAX_CONCURRENTES):
+    # Atiende hasta Ctrl+C
+    global cupos_api
+    cupos_api = threading.BoundedSemaphore(concurrentes)
+    if concurrentes > controller.pool:
+        configurar_controlador(BASE_URL, pool=concurrentes)
+    servidor = crear_servidor_api(host, puerto)
+    print(f"🌐 API escuchando en http://{host}:{servidor.server_address[1]} "
+          f"({len(base_datos.alumnos)} alumnos, {len(base_datos.conexiones)} conexiones)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("API detenida.")
+    finally:
+        servidor.server_close()
+
+
+# ==================== CLI =====================
+
+def cli_import(args):
+    return 0 if importar_archivo(args.archivo, args.streaming) else 1
+
+
+def cli_export(args):
+    return 0 if exportar_archivo(args.archivo) else 1
+
+
+def cli_connect(args):
+    conexion, error = conectar(args.alumno, args.servidor, args.servicio, verbose=args.verbose)
+    if conexion is None:
+        print(error)
+        return 1
+    print(f"Conexión creada con handler: {conexion.handler}")
+    return 0
+
+
+def cli_disconnect(args):
+    if args.alumno is not None:
+        conexiones = base_datos.conexiones_de_alumno(args.alumno)
+    elif args.curso:
+        curso = base_datos.curso(args.curso.upper())
+        if curso is None:
+            print("Curso no encontrado.")
+            return 1
+        conexiones = base_datos.conexiones_de_curso(curso)
+    elif args.servidor:
+        conexiones = base_datos.conexiones_de_servidor(args.servidor)
+    else:
+        conexiones = []
+        for handler in args.handlers:
+            conexion = base_datos.conexion(handler)
+            if conexion is None:
+                print(f"Conexión {handler} no encontrada.")
+                return 1
+            conexiones.append(conexion)
+    if not conexiones:
+        print("📭 No hay conexiones que borrar.")
+        return 0
+    fallos = eliminar_conexiones(conexiones, workers=args.workers)
+    con_fallos = sum(1 for pendientes in fallos.values() if pendientes)
+    print(f"{len(conexiones) - con_fallos} conexiones eliminadas, {con_fallos} con errores.")
+    return 1 if con_fallos else 0
+
+
+def cli_bulk_connect(args):
+    resultados = provisionar_curso(args.curso.upper() if args.curso else None, workers=args.workers)
+    return 1 if any(not ok for _, ok, _ in resultados) else 0
+
+
+def cli_list(args):
+    # Una línea por entidad, campos separados por tabuladores
+    if args.que == "alumnos":
+        filas = [(a.codigo, a.nombre, a.mac) for a in base_datos.alumnos.values()]
+    elif args.que == "cursos":
+        filas = [(c.codigo, c.estado, c.nombre, len(c.alumnos)) for c in base_datos.cursos.values()]
+    elif args.que == "servidores":
+        filas = [(s.nombre, s.ip, ",".join(svc.nombre for svc in s.servicios))
+                 for s in base_datos.servidores.values()]
+    else:
+        filas = [(c.handler, c.alumno.codigo, c.servidor.nombre, c.servicio.nombre, len(c.flows))
+                 for c in base_datos.conexiones.values()]
+    sys.stdout.write("".join("\t".join(map(str, fila)) + "\n" for fila in filas))
+    return 0
+
+
+def cli_plan(args):
+    if args.capturar:
+        red = SnapshotRed.capturar()
+        if red is None:
+            print("No se pudo obtener dispositivos y enlaces del controlador.")
+            return 1
+        red.guardar(args.red)
+    else:
+        red = SnapshotRed.cargar(args.red)
+    plan = planificar(red, args.capacidad, args.workers, args.top, verbose=not args.json)
+    if args.json:
+        print(json.dumps(plan, indent=2))
+    return 1 if plan["switches_excedidos"] else 0
+
+
+def cli_batch(args):
+    # Ejecuta un comando por línea (misma sintaxis que el CLI, sin opciones
+    # globales) en este mismo proceso: comparten sesión HTTP, cachés y estado
+    parser = crear_parser()
+    archivo = sys.stdin if args.archivo == "-" else open(args.archivo)
+    errores = 0
+    try:
+        for numero, linea in enumerate(archivo, 1):
+            palabras = shlex.split(linea, comments=True)
+            if not palabras:
+                continue
+            try:
+                sub = parser.parse_args(palabras)
+            except SystemExit:
+                sub = None
+            if sub is None or sub.funcion is cli_batch:
+                print(f"❌ Línea {numero}: comando inválido: {linea.strip()}")
+                codigo = 2
+            else:
+                codigo = sub.funcion(sub)
+            if codigo:
+                errores += 1
+                if not args.continuar:
+                    print(f"Lote detenido en la línea {numero}.")
+                    return codigo
+    finally:
+        if archivo is not sys.stdin:
+            archivo.close()
+    return 1 if errores else 0
+
+
+def cli_serve(args):
+    servir_api(args.host, args.puerto, args.concurrentes)
+    return 0
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        prog="lab6_20211688.py",
+        description="Network Policy manager. Sin argumentos abre el menú interactivo.")
+    parser.add_argument("--estado", help="almacén SQLite (.db, .sqlite) que se actualiza en cada cambio, "
+                                         "o instantánea JSON que se carga al inicio y se guarda al terminar")
+    parser.add_argument("--controlador", help=f"URL del controlador (por defecto {BASE_URL})")
+    parser.add_argument("--agregado", action="store_true",
+                        help="crear las conexiones nuevas en modo agregado (flows compartidos fuera del "
+                             "switch del alumno)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("import", help="importar roster (.yaml, .jsonl o .bin según la extensión)")
+    p.add_argument("archivo")
+    p.add_argument("--streaming", action=argparse.BooleanOptionalAction, default=None,
+                   help=f"forzar (o no) la importación streaming; por defecto a partir de "
+                        f"{STREAM_IMPORT_THRESHOLD // (1024 * 1024)} MB")
+    p.set_defaults(funcion=cli_import, modifica=True)
+
+    p = sub.add_parser("export", help="exportar roster (.yaml, .jsonl o .bin según la extensión)")
+    p.add_argument("archivo")
+    p.set_defaults(funcion=cli_export, modifica=False)
+
+    p = sub.add_parser("connect", help="crear una conexión")
+    p.add_argument("alumno", help="código del alumno")
+    p.add_argument("servidor")
+    p.add_argument("servicio")
+    p.add_argument("-v", "--verbose", action="store_true")
+    p.set_defaults(funcion=cli_connect, modifica=True)
+
+    p = sub.add_parser("disconnect", help="borrar conexiones por handler, alumno, curso o servidor")
+    p.add_argument("handlers", nargs="*")
+    grupo = p.add_mutually_exclusive_group()
+    grupo.add_argument("--alumno", type=int)
+    grupo.add_argument("--curso")
+    grupo.add_argument("--servidor")
+    p.add_argument("--workers", type=int, default=TEARDOWN_WORKERS)
+    p.set_defaults(funcion=cli_disconnect, modifica=True)
+
+    p = sub.add_parser("bulk-connect", help="provisión masiva de un curso (o de todos los DICTANDO)")
+    p.add_argument("curso", nargs="?")
+    p.add_argument("--workers", type=int, default=BULK_WORKERS)
+    p.set_defaults(funcion=cli_bulk_connect, modifica=True)
+
+    p = sub.add_parser("list", help="listar alumnos, cursos, servidores o conexiones")
+    p.add_argument("que", nargs="?", default="conexiones", choices=("alumnos", "cursos", "servidores", "conexiones"))
+    p.set_defaults(funcion=cli_list, modifica=False)
+
+    p = sub.add_parser("plan", help="simular la provisión de todas las conexiones autorizadas sobre un "
+                                     "snapshot de la red y proyectar flows por switch y llamadas REST")
+    p.add_argument("--red", required=True, help="snapshot JSON de dispositivos y enlaces")
+    p.add_argument("--capturar", action="store_true", help="tomar el snapshot del controlador y guardarlo en --red")
+    p.add_argument("--capacidad", type=int, default=FLOW_TABLE_CAPACITY, help="flows por switch")
+    p.add_argument("--workers", type=int, default=BULK_WORKERS)
+    p.add_argument("--top", type=int, default=10)
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(funcion=cli_plan, modifica=False)
+
+    p = sub.add_parser("serve", help="atender la API HTTP/JSON de conexiones, alumnos y cursos hasta Ctrl+C")
+    p.add_argument("--host", default=API_HOST)
+    p.add_argument("--puerto", type=int, default=API_PUERTO)
+    p.add_argument("--concurrentes", type=int, default=API_MAX_CONCURRENTES,
+                   help="creaciones/borrados que llaman al controlador a la vez")
+    p.set_defaults(funcion=cli_serve, modifica=True)
+
+    p = sub.add_parser("batch", help="ejecutar un archivo de comandos, uno por línea ('-' = stdin)")
+    p.add_argument("archivo")
+    p.add_argument("--continuar", action="store_true", help="seguir con las líneas siguientes si una falla")
+    p.set_defaults(funcion=cli_batch, modifica=True)
+    return parser
+
+
+def ejecutar_cli(argv):
+    global AGREGAR_FLOWS
+    args = crear_parser().parse_args(argv)
+    if args.controlador:
+        configurar_controlador(args.controlador)
+    if args.agregado:
+        AGREGAR_FLOWS = True
+    sqlite = bool(args.estado) and args.estado.endswith(EXTENSIONES_ALMACEN)
+    if sqlite:
+        abrir_almacen(args.estado, verbose=False)
+    elif args.estado and os.path.exists(args.estado):
+        cargar_estado(args.estado)
+    try:
+        return args.funcion(args)
+    finally:
+        if args.estado and not sqlite and args.modifica:
+            guardar_estado(args.estado)
+        cerrar_almacen()
+        controller.cerrar()
+
+
 # ==================== MAIN =====================
 
-def main():
-    menu()
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        return ejecutar_cli(argv)
+    if ALMACEN_ARCHIVO:
+        abrir_almacen(ALMACEN_ARCHIVO)
+    try:
+        menu()
+    finally:
+        cerrar_almacen()
+    return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file